@@ -4,6 +4,14 @@ import requests
 from datetime import datetime
 from PyQt6.QtCore import QObject, pyqtSignal
 
+from core.metrics import MetricsServer
+from core.profiler import ScanProfiler
+from core.vision_pool import VisionPool
+from core.capture import CaptureService
+from core.scheduler import ScanScheduler
+from core.governor import QualityGovernor
+from core.capture_backends import CONFIG_BACKENDS
+
 class AlarmWorker(QObject):
     log_signal = pyqtSignal(str)
     probe_signal = pyqtSignal(bool)
@@ -16,6 +24,9 @@ class AlarmWorker(QObject):
         self.running = False
         self.thread = None
         self.first_run = True 
+        # 扫描间隔的睡眠在此事件上等待: stop() / 配置变化时立即唤醒
+        self.wake = threading.Event()
+        self.cfg.add_listener(self._on_config_changed)
         
         self.threat_persistence = {}
         self.CONFIRM_CYCLES = 2 
@@ -25,63 +36,321 @@ class AlarmWorker(QObject):
         self.last_probe_time = 0.0
         self.REPEAT_INTERVAL = 2.0 
         
-        self.last_location_check_time = 0.0
+        # 各阶段耗时统计，与 VisionEngine 共用
+        self.metrics = vision_engine.metrics
+        self.metrics_server = None
+        
+        # 周期预算调度: Local/Overview 每周期扫描，Monster/Probe/Location 超预算时跨周期轮转
+        self.scheduler = ScanScheduler(self.metrics)
+        # 各客户端各区域最近一次的匹配结果 (本周期未扫描的区域沿用)
+        self.last_counts = {}
+        # 超预算时逐级降低扫描质量 (跳过位置 / 半分辨率预过滤 / 降低 Monster/Probe 频率)，有余量时恢复
+        self.governor = QualityGovernor(vision_engine, self.scheduler, self.metrics)
+        
+        # 按需剖析 (设置窗口按钮 / profile.request 信号文件)
+        self.profiler = ScanProfiler(vision_engine)
+        
+        # 多进程匹配 (vision_workers > 0 时启用)
+        self.pool = None
+        
+        # 后台抓图线程 (capture_thread 为 true 时启用)；本客户端各区域帧的抓图时间戳
+        self.capture = None
+        self.capture_errors = {}
+        self.frame_times = []
 
     def start(self):
         if not self.running:
+            if self.thread and self.thread.is_alive():
+                # 上一次 stop() 不等待扫描线程退出；重新启动前等它结束当前周期
+                self.thread.join()
+            self.wake.clear()
             self.running = True
             self.first_run = True 
             self.threat_persistence = {}
             self.last_alert_time = 0.0
             self.last_alert_type = None
             self.last_probe_time = 0.0
-            self.last_location_check_time = 0.0
+            self.last_counts = {}
+            self.scheduler.reset()
+            self.governor.reset()
+            self.vision.reset_region_state()
+            self.start_metrics_server()
+            backend = self.cfg.get("capture_backend") or "mss"
+            if backend not in CONFIG_BACKENDS:
+                self.log_signal.emit(f"Capture Backend Error: unknown capture_backend '{backend}' "
+                                     f"({' / '.join(CONFIG_BACKENDS)}), using mss")
+                backend = "mss"
+            if backend != self.vision.CAPTURE_BACKEND and not self.vision.backend_injected:
+                self.vision.set_capture_backend(backend)
+            self.vision.DETECTION_ENGINE = self.cfg.get("detection_engine") or "template"
+            self.vision.LOCATION_ENGINE = self.cfg.get("location_engine") or "glyphs"
+            if self.cfg.get("capture_thread"):
+                self.capture = CaptureService(self.vision)
+                self.capture_errors = {}
             self.thread = threading.Thread(target=self._loop, daemon=True)
             self.thread.start()
 
-    def stop(self):
+    def stop(self, wait=False):
+        """
+        立即返回: 唤醒正在睡眠的扫描线程，进程池 / 抓图线程由扫描线程退出时释放
+        wait=True 时等待扫描线程结束 (程序退出时用，保证工作进程被关闭)
+        """
         self.running = False
-        if self.thread:
+        self.wake.set()
+        if wait and self.thread:
             self.thread.join()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def _on_config_changed(self, key, value):
+        # 扫描线程自己写回的配置 (如检测到的缩放) 不需要唤醒
+        if self.running and threading.current_thread() is not self.thread:
+            self.wake.set()
+
+    def _intervals(self):
+        jitter_delay = self.cfg.get("jitter_delay")
+        if jitter_delay is None: jitter_delay = 0.18
+        scan_interval = self.cfg.get("scan_interval")
+        if scan_interval is None: scan_interval = 0.5
+        return jitter_delay, scan_interval
+
+    def _sleep_until_next(self, planned, pending):
+        """
+        按单调时钟睡到下一次计划扫描时刻 (上次计划时刻 + 间隔，不随周期耗时漂移)，返回下一次的计划时刻
+        配置变化唤醒后按新间隔重新计算；周期已超时 (或新间隔下早已过期) 则不睡眠，并以当前时刻重新对齐
+        """
+        waited = False
+        while self.running:
+            jitter_delay, scan_interval = self._intervals()
+            interval = jitter_delay if pending else scan_interval
+            due = planned + interval
+            now = time.monotonic()
+            if now >= due:
+                return due if waited and now - due < interval else now
+            remaining = due - now
+            self.wake.wait(remaining)
+            self.wake.clear()
+            waited = True
+        return time.monotonic()
+
+    def start_metrics_server(self):
+        port = self.cfg.get("metrics_port")
+        if not port or self.metrics_server:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, int(port))
+            self.metrics_server.start()
+            self.log_signal.emit(f"Metrics: {self.metrics_server.url} (+ /metrics.json)")
+        except Exception as e:
+            self.metrics_server = None
+            self.log_signal.emit(f"Metrics Server Error: {e}")
+
+    def start_vision_pool(self):
+        """模板加载后 (首轮) 调用；每次启动都重建进程池，让工作进程拿到最新模板"""
+        self.stop_vision_pool()
+        workers = self.cfg.get("vision_workers")
+        if not workers:
+            return
+        try:
+            self.pool = VisionPool(self.vision, int(workers))
+            self.pool.start()
+            self.log_signal.emit(f"Vision Pool: {int(workers)} worker processes")
+        except Exception as e:
+            self.stop_vision_pool()
+            self.log_signal.emit(f"Vision Pool Error: {e}")
+
+    def stop_vision_pool(self):
+        if self.pool:
+            self.pool.stop()
+            self.pool = None
+
+    def _count_all(self, client_id, scale, specs):
+        """
+        specs: [(img, type_key, threshold, safe_color), ...]，返回 [(count, score), ...]
+        进程池可用时先全部提交再收集结果；进程池出错则关闭并回退到本进程匹配
+        """
+        if self.pool:
+            try:
+                t0 = time.perf_counter()
+                # 结果缓存在主进程查询，命中的帧不再提交给工作进程
+                jobs = []
+                for img, type_key, th, safe in specs:
+                    tmpls = self.vision.templates[type_key].get(scale, [])
+                    cache_key = self.vision.count_cache_key(img, tmpls, th, safe)
+                    cached = self.vision.result_cache.get(cache_key, "count") if cache_key else None
+                    job = None
+                    if cached is None:
+                        job = self.pool.submit(img, type_key, scale, th, safe, (client_id, type_key))
+                    jobs.append((cache_key, cached, job))
+                out = []
+                for (cache_key, cached, job), (_, type_key, _, _) in zip(jobs, specs):
+                    if cached is not None:
+                        out.append(cached)
+                        continue
+                    cnt, score, worker_ms = self.pool.result(job)
+                    self.metrics.observe("match", worker_ms, client_id, type_key)
+                    self.scheduler.observe(client_id, type_key, worker_ms)
+                    if cache_key is not None:
+                        self.vision.result_cache.put(cache_key, (cnt, score))
+                    out.append((cnt, score))
+                self.metrics.observe("pool_roundtrip", (time.perf_counter() - t0) * 1000.0, client_id, "")
+                return out
+            except Exception as e:
+                self.log_signal.emit(f"Vision Pool Error: {e} (falling back to in-process matching)")
+                self.stop_vision_pool()
+
+        out = []
+        for img, type_key, th, safe in specs:
+            tmpls = self.vision.templates[type_key].get(scale, [])
+            t0 = time.perf_counter()
+            with self.metrics.labels(client_id, type_key):
+                out.append(self.vision.count_matches(img, tmpls, th, check_safe_color=safe,
+                                                     key=(client_id, type_key)))
+            self.scheduler.observe(client_id, type_key, (time.perf_counter() - t0) * 1000.0)
+        return out
+
+    def _count_scans(self, scans, thresholds):
+        """
+        scans: 第一阶段各客户端的画面，返回对应的 [{区域: (count, score)}, ...]，只含本周期抓取了画面的区域
+        拼图开启且不使用进程池时，MOSAIC_TYPES 中的区域按缩放合并所有客户端批量匹配，其余区域逐客户端匹配
+        """
+        types = ["local", "overview", "monster", "probe"]
+        specs = {t: (thresholds.get(t, 0.95), t in ("local", "overview")) for t in types}
+        results = [{} for _ in scans]
+        batched = ()
+        if self.vision.MOSAIC_BATCH and not self.pool and len(scans) >= self.vision.MOSAIC_MIN_FRAMES:
+            batched = self.vision.MOSAIC_TYPES
+            by_scale = {}
+            for n, scan in enumerate(scans):
+                by_scale.setdefault(scan["scale"], []).append(n)
+            for scale, members in by_scale.items():
+                for type_key in batched:
+                    members_t = [n for n in members if type_key in scans[n]["imgs"]]
+                    if not members_t:
+                        continue
+                    tmpls = self.vision.templates[type_key].get(scale, [])
+                    frames = [((scans[n]["client_id"], type_key), scans[n]["imgs"][type_key]) for n in members_t]
+                    th, safe = specs[type_key]
+                    t0 = time.perf_counter()
+                    out = self.vision.count_matches_batch(frames, tmpls, th, check_safe_color=safe)
+                    share = (time.perf_counter() - t0) * 1000.0 / len(frames)
+                    for n, result in zip(members_t, out):
+                        results[n][type_key] = result
+                        self.scheduler.observe(scans[n]["client_id"], type_key, share)
+
+        for n, scan in enumerate(scans):
+            rest = [t for t in types if t not in batched and t in scan["imgs"]]
+            out = self._count_all(scan["client_id"], scan["scale"],
+                                  [(scan["imgs"][t], t) + specs[t] for t in rest])
+            results[n].update(zip(rest, out))
+        return results
+
+    def _capture(self, client_id, key, region):
+        t0 = time.perf_counter()
+        try:
+            with self.metrics.timer("capture", client_id, key):
+                if self.capture:
+                    img, ts = self.capture.read(region)
+                    if img is not None:
+                        self.frame_times.append(ts)
+                        return img
+                ts = time.perf_counter()
+                img = self.vision.capture_screen(region)
+                if img is not None:
+                    self.frame_times.append(ts)
+                return img
+        finally:
+            self.scheduler.observe(client_id, key, (time.perf_counter() - t0) * 1000.0)
+
+    def _update_capture(self, groups, interval):
+        regions = [r for grp in groups for r in grp["regions"].values() if r]
+        try:
+            self.capture.update_regions(regions, interval)
+        except Exception as e:
+            self.log_signal.emit(f"Capture Thread Error: {e} (falling back to inline capture)")
+            self.capture.stop()
+            self.capture = None
+            return
+        # 抓图线程出错期间 read() 不返回旧帧，本周期对应区域直接截图；每个新错误只记录一次
+        errors = self.capture.errors()
+        for idx, error in errors.items():
+            if self.capture_errors.get(idx) != error:
+                self.log_signal.emit(f"Capture Thread Error (monitor {idx}): {error} (falling back to inline capture)")
+        self.capture_errors = errors
 
     def _loop(self):
+        try:
+            self._run_cycles()
+        finally:
+            self.stop_vision_pool()
+            if self.capture:
+                self.capture.stop()
+                self.capture = None
+            # 释放扫描线程自己的截图后端实例 (mss / X display 句柄)
+            self.vision.close_capture_backend()
+
+    def _run_cycles(self):
+        planned = time.monotonic()
         while self.running:
-            loop_start_time = time.time()
+            loop_start_time = time.monotonic()
             now = datetime.now()
             now_str = now.strftime("%H:%M:%S")
             
-            jitter_delay = self.cfg.get("jitter_delay")
-            if jitter_delay is None: jitter_delay = 0.18
-            scan_interval = self.cfg.get("scan_interval")
-            if scan_interval is None: scan_interval = 0.5
+            jitter_delay, scan_interval = self._intervals()
             
+            warmup = self.first_run
+            if not warmup:
+                # 计划扫描时刻与实际开始时刻之差 (定时抖动)
+                self.metrics.observe("scan_jitter", (loop_start_time - planned) * 1000.0, "", "")
             if self.first_run:
+                self.vision.EXTRA_SCALES = [str(x) for x in (self.cfg.get("extra_scales") or [])]
                 self.vision.load_templates()
+                stats = self.vision.template_stats
                 report = (
                     f"[{now_str}] System Check: Templates Loaded.\n"
+                    f"[{now_str}] Templates: {stats['unmasked']} fast path / {stats['masked']} masked"
+                    f" ({stats['cropped']} cropped, {stats['synthesized']} synthesized"
+                    f"{', cached' if stats.get('from_cache') else ''})\n"
                     f"[{now_str}] Logic: Smart Frequency ({scan_interval}s / {jitter_delay}s)"
                 )
                 self.log_signal.emit(report)
+                # 在扫描线程上创建截图后端: 配置的后端不可用时在此记录一次回退
+                self.vision.capture_backend()
+                failed = self.vision.backend_fallback.get(self.vision.CAPTURE_BACKEND)
+                if failed is not None:
+                    self.log_signal.emit(f"Capture Backend Error ({self.vision.CAPTURE_BACKEND}): {failed} (falling back to mss)")
+                self.start_vision_pool()
                 self.first_run = False
-                time.sleep(1)
+                self.wake.wait(1)
+                self.wake.clear()
+                if not self.running:
+                    break
+
+            self.profiler.begin_cycle()
 
             groups = self.cfg.get("groups")
             thresholds = self.cfg.get("thresholds")
+            if self.capture:
+                self._update_capture(groups, min(jitter_delay, scan_interval))
             
             any_probe_triggered = False
             major_sound = None
             pending_threat_detected = False
             
-            check_location = (loop_start_time - self.last_location_check_time) >= 3.0
-            if check_location:
-                self.last_location_check_time = loop_start_time
+            # 本周期各客户端扫描的区域 (cycle_budget_ms 为 0 时以 scan_interval 为预算)
+            budget_ms = self.cfg.get("cycle_budget_ms") or scan_interval * 1000.0
+            plan = self.scheduler.plan([f"C{i+1}" for i in range(len(groups))], budget_ms)
 
+            # 第一阶段: 逐客户端抓图 (含缩放检测 / 星系名识别)
+            scans = []
             for i, grp in enumerate(groups):
                 client_id = f"C{i+1}"
                 regions = grp["regions"]
                 current_scale = grp.get("scale")
                 
-                img_local = self.vision.capture_screen(regions.get("local"))
+                self.frame_times = []
+                img_local = self._capture(client_id, "local", regions.get("local"))
                 
                 if not current_scale:
                     if img_local is not None:
@@ -104,35 +373,56 @@ class AlarmWorker(QObject):
                     grp["scale"] = None
                     continue
 
-                img_overview = self.vision.capture_screen(regions.get("overview"))
-                img_monster = self.vision.capture_screen(regions.get("monster"))
-                img_probe = self.vision.capture_screen(regions.get("probe"))
+                wanted = plan[client_id]
+                imgs = {"local": img_local}
+                for key in ("overview", "monster", "probe"):
+                    if key in wanted:
+                        imgs[key] = self._capture(client_id, key, regions.get(key))
                 
                 current_system = ""
-                if check_location:
-                    img_location = self.vision.capture_screen(regions.get("location"))
+                if "location" in wanted:
+                    img_location = self._capture(client_id, "location", regions.get("location"))
                     loc_thresh = thresholds.get("location", 0.85)
-                    sys_name, sys_score = self.vision.match_location_name(img_location, current_scale, loc_thresh)
+                    t_loc = time.perf_counter()
+                    with self.metrics.labels(client_id, "location"), self.metrics.timer("location"):
+                        sys_name, sys_score = self.vision.match_location_name(img_location, current_scale, loc_thresh,
+                                                                         key=(client_id, "location"))
+                    self.scheduler.observe(client_id, "location", (time.perf_counter() - t_loc) * 1000.0)
                     if sys_name:
                         current_system = sys_name
                         self.location_update_signal.emit(i, sys_name)
                     else:
                         self.location_update_signal.emit(i, "Unknown")
 
+                scans.append({"i": i, "client_id": client_id, "scale": current_scale, "system": current_system,
+                              "frame_times": self.frame_times, "imgs": imgs})
+
+            # 第二阶段: 所有客户端的画面到齐后统一匹配 (同缩放的区域可拼图批量匹配)
+            counts = self._count_scans(scans, thresholds)
+            self.scheduler.commit(plan)
+
+            # 第三阶段: 逐客户端判定
+            for scan, scan_counts in zip(scans, counts):
+                i, client_id = scan["i"], scan["client_id"]
+                current_system = scan["system"]
+
                 if i not in self.threat_persistence:
                     self.threat_persistence[i] = {"local": 0, "overview": 0, "monster": 0, "probe": 0}
+                last = self.last_counts.setdefault(i, {})
+                last.update(scan_counts)
 
-                def check(img, type_key, th, safe_color):
-                    tmpls = self.vision.templates[type_key].get(current_scale, [])
-                    cnt, score = self.vision.count_matches(img, tmpls, th, check_safe_color=safe_color)
-                    return cnt, score
+                (cnt_local, s_loc), (cnt_overview, s_ovr), (cnt_monster, s_mon), (cnt_probe, s_prb) = [
+                    last.get(t, (0, 0.0)) for t in ("local", "overview", "monster", "probe")]
 
-                cnt_local, s_loc = check(img_local, "local", thresholds.get("local", 0.95), True)
-                cnt_overview, s_ovr = check(img_overview, "overview", thresholds.get("overview", 0.95), True)
-                cnt_monster, s_mon = check(img_monster, "monster", thresholds.get("monster", 0.95), False)
-                cnt_probe, s_prb = check(img_probe, "probe", thresholds.get("probe", 0.95), False)
+                t_decision = time.perf_counter()
+                if scan["frame_times"]:
+                    # 帧龄: 本客户端最早抓取的一帧到开始判定的时间
+                    self.metrics.observe("frame_age", (t_decision - min(scan["frame_times"])) * 1000.0, client_id, "")
 
                 def update_persistence(key, count):
+                    if key not in scan_counts:
+                        # 本周期未扫描 (顺延到后面的周期): 保持上次的确认状态，不计入连续周期数，也不触发极速确认
+                        return self.threat_persistence[i][key] >= self.CONFIRM_CYCLES, False
                     is_detected = count > 0
                     if is_detected:
                         self.threat_persistence[i][key] += 1
@@ -180,8 +470,10 @@ class AlarmWorker(QObject):
                     f"P:{fmt(cnt_probe, s_prb, is_probe, p_probe)}"
                     f"{loc_str}"
                 )
+                self.metrics.observe("decision", (time.perf_counter() - t_decision) * 1000.0, client_id, "")
                 self.log_signal.emit(log_line)
 
+            t_dispatch = time.perf_counter()
             if any_probe_triggered:
                 if loop_start_time - self.last_probe_time > 2.0:
                     self.probe_signal.emit(True)
@@ -206,17 +498,35 @@ class AlarmWorker(QObject):
                         except: pass
             else:
                 self.last_alert_type = None
+            self.metrics.observe("dispatch", (time.perf_counter() - t_dispatch) * 1000.0, "", "")
 
             # === 睡眠控制 (优化版) ===
             # 只有在 "疑似威胁正在确认中" (Pending) 时，才使用极速模式 (0.18s)
             # 无论是 "完全安全" 还是 "已经确认并报警" (Confirmed)，都回归用户设置的常规频率 (0.5s)
             # 这样报警时的日志就不会刷得太快了
-            elapsed = time.time() - loop_start_time
+            elapsed = time.monotonic() - loop_start_time
+
+            profile_out = self.profiler.end_cycle()
+            if profile_out:
+                self.log_signal.emit(f"[{now_str}] Profile Saved: {profile_out}.txt / .pstats / .folded")
             
             if pending_threat_detected:
                 target_sleep = jitter_delay
             else:
                 target_sleep = scan_interval
             
-            actual_sleep = max(0.0, target_sleep - elapsed)
-            time.sleep(actual_sleep)
+            if not warmup:
+                self.metrics.observe("cycle", elapsed * 1000.0, "", "")
+                if self.cfg.get("quality_governor") is not False:
+                    change = self.governor.update(elapsed * 1000.0, budget_ms,
+                                                  float(self.cfg.get("cpu_budget_pct") or 0), scan_interval)
+                    if change:
+                        self.log_signal.emit(f"[{now_str}] {change}")
+                        if self.pool:
+                            # 工作进程只在启动时复制一次参数，运行中的修改需要转发
+                            self.pool.tune(self.governor.tunables())
+            if elapsed > target_sleep and not warmup:
+                interval_key = "jitter_delay" if pending_threat_detected else "scan_interval"
+                self.metrics.inc("cycle_overruns", {"interval": interval_key})
+            
+            planned = self._sleep_until_next(planned, pending_threat_detected)
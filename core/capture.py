@@ -0,0 +1,158 @@
+import time
+import threading
+import cv2
+import numpy as np
+
+
+def _contains(outer, inner):
+    return (inner[0] >= outer[0] and inner[1] >= outer[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+def _union(rects):
+    left = min(r[0] for r in rects)
+    top = min(r[1] for r in rects)
+    right = max(r[0] + r[2] for r in rects)
+    bottom = max(r[1] + r[3] for r in rects)
+    return (left, top, right - left, bottom - top)
+
+
+class MonitorCapture:
+    """
+    单个显示器的后台抓图线程: 只抓所登记区域的外接矩形，按节奏刷新预分配的双缓冲
+    写入后台缓冲后在锁内交换；读取方在锁内从前台缓冲复制裁剪，不会读到半帧
+    抓图出错或前台帧早于 STALE_FACTOR 个抓图周期时不再提供旧帧，由调用方直接截图
+    """
+    STALE_FACTOR = 2.0
+
+    def __init__(self, vision, bounds, interval):
+        self.vision = vision
+        self.bounds = bounds
+        self.interval = interval
+        self.lock = threading.Lock()
+        h, w = bounds[3], bounds[2]
+        self.front = np.zeros((h, w, 3), dtype=np.uint8)
+        self.back = np.zeros((h, w, 3), dtype=np.uint8)
+        self.front_ts = None
+        self.grab_ms = 0.0
+        self.last_error = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        # 后端实例按线程创建，线程退出时释放
+        backend = self.vision.capture_backend()
+        try:
+            while self.running:
+                t0 = time.perf_counter()
+                try:
+                    raw = backend.grab(self.bounds)
+                    self.grab_ms = (time.perf_counter() - t0) * 1000.0
+                    self.vision.metrics.observe("grab", self.grab_ms, "", backend.name)
+                    if raw.shape[:2] == self.back.shape[:2]:
+                        cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=self.back)
+                    else:
+                        self.back = cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR)
+                    with self.lock:
+                        self.front, self.back = self.back, self.front
+                        self.front_ts = t0
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = f"Screenshot Error: {str(e)}"
+                elapsed = time.perf_counter() - t0
+                time.sleep(max(0.005, self.interval - elapsed))
+        finally:
+            self.vision.close_capture_backend()
+
+    def read(self, region):
+        """返回 (裁剪副本, 抓图时间戳 perf_counter)；尚无完整帧、抓图出错或帧已过期时返回 (None, None)"""
+        x = int(region[0]) - self.bounds[0]
+        y = int(region[1]) - self.bounds[1]
+        w, h = int(region[2]), int(region[3])
+        # 抓图本身慢于间隔时按实际抓图耗时计算周期
+        max_age = self.STALE_FACTOR * max(self.interval, self.grab_ms / 1000.0)
+        with self.lock:
+            if self.front_ts is None or self.last_error is not None:
+                return None, None
+            if time.perf_counter() - self.front_ts > max_age:
+                return None, None
+            crop = self.front[y:y + h, x:x + w]
+            if crop.shape[0] != h or crop.shape[1] != w:
+                return None, None
+            return crop.copy(), self.front_ts
+
+
+class CaptureService:
+    """
+    每个显示器一个后台抓图线程，匹配线程直接取最新完成的帧，不再等待截图
+    update_regions() 每周期登记当前所有区域；区域超出已有抓取范围时重建该显示器的线程
+    """
+    def __init__(self, vision, interval=0.18):
+        self.vision = vision
+        self.interval = interval
+        self.monitors = None
+        self.captures = {}
+
+    def _monitor_of(self, region):
+        if self.monitors is None:
+            self.monitors = self.vision.capture_backend().monitors()
+        for idx, mon in enumerate(self.monitors):
+            if mon[0] <= region[0] < mon[0] + mon[2] and mon[1] <= region[1] < mon[1] + mon[3]:
+                return idx
+        return None
+
+    def update_regions(self, regions, interval=None):
+        if interval is not None:
+            self.interval = interval
+        by_monitor = {}
+        for region in regions:
+            if not region or region[2] <= 0 or region[3] <= 0:
+                continue
+            region = tuple(int(v) for v in region)
+            idx = self._monitor_of(region)
+            if idx is not None:
+                by_monitor.setdefault(idx, []).append(region)
+
+        for idx, rects in by_monitor.items():
+            cap = self.captures.get(idx)
+            if cap is not None:
+                cap.interval = self.interval
+                if all(_contains(cap.bounds, r) for r in rects):
+                    continue
+                cap.stop()
+            cap = self.captures[idx] = MonitorCapture(self.vision, _union(rects), self.interval)
+            cap.start()
+
+    def read(self, region):
+        """区域已被某个抓图线程覆盖时返回 (图像, 时间戳)，否则 (None, None)，由调用方直接截图"""
+        if not region:
+            return None, None
+        region = tuple(int(v) for v in region)
+        for cap in self.captures.values():
+            if _contains(cap.bounds, region):
+                return cap.read(region)
+        return None, None
+
+    def grab_ms(self):
+        return {idx: cap.grab_ms for idx, cap in self.captures.items()}
+
+    def errors(self):
+        """{显示器序号: 最近一次抓图错误}，正常的显示器不列出"""
+        return {idx: cap.last_error for idx, cap in self.captures.items() if cap.last_error}
+
+    def stop(self):
+        for cap in self.captures.values():
+            cap.stop()
+        self.captures = {}
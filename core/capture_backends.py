@@ -0,0 +1,230 @@
+import ctypes
+import ctypes.util
+import threading
+import cv2
+import mss
+import numpy as np
+
+# 截图后端: grab(region) 返回 BGRA uint8 数组 (h, w, 4)
+# 返回值可能是后端内部缓冲的视图，只保证在同一线程下一次 grab 之前有效
+
+
+class CaptureBackend:
+    name = "base"
+    # True: 所有线程共用一个实例；False: 每个线程各自创建 (mss / Xlib 句柄不能跨线程)
+    shared = False
+
+    def grab(self, region):
+        raise NotImplementedError
+
+    def monitors(self):
+        """[(left, top, width, height), ...]"""
+        return []
+
+    def close(self):
+        pass
+
+
+class MssBackend(CaptureBackend):
+    """mss 截图，复用同一个 mss 实例 (原实现每次截图都新建)"""
+    name = "mss"
+
+    def __init__(self):
+        self.sct = mss.mss()
+
+    def grab(self, region):
+        shot = self.sct.grab({"top": int(region[1]), "left": int(region[0]),
+                              "width": int(region[2]), "height": int(region[3])})
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def monitors(self):
+        return [(m["left"], m["top"], m["width"], m["height"]) for m in self.sct.monitors[1:]]
+
+    def close(self):
+        self.sct.close()
+
+
+class _XImage(ctypes.Structure):
+    # 只声明需要读取的前部字段 (Xlib.h struct _XImage)
+    _fields_ = [
+        ("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int), ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int), ("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int), ("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int),
+                ("shmaddr", ctypes.c_void_p), ("readOnly", ctypes.c_int)]
+
+
+class XShmBackend(CaptureBackend):
+    """
+    X11 MIT-SHM: 每种区域尺寸创建一次共享内存 XImage，XShmGetImage 直接写入，
+    返回共享内存上的 numpy 视图，截图本身无内存分配 (Linux，可在 Xvfb 下开发/测速)
+    """
+    name = "xshm"
+    ZPIXMAP = 2
+    ALL_PLANES = 0xFFFFFFFF
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+
+    def __init__(self):
+        x11_path = ctypes.util.find_library("X11")
+        xext_path = ctypes.util.find_library("Xext")
+        if not x11_path or not xext_path:
+            raise RuntimeError("libX11 / libXext not found")
+        self.x11 = x11 = ctypes.CDLL(x11_path)
+        self.xext = xext = ctypes.CDLL(xext_path)
+        self.libc = libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XRootWindow.restype = ctypes.c_ulong
+        x11.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_char_p, ctypes.POINTER(_XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        self.display = x11.XOpenDisplay(None)
+        if not self.display:
+            raise RuntimeError("cannot open X display")
+        if not xext.XShmQueryExtension(self.display):
+            x11.XCloseDisplay(self.display)
+            raise RuntimeError("MIT-SHM extension not available")
+        self.screen = x11.XDefaultScreen(self.display)
+        self.root = x11.XRootWindow(self.display, self.screen)
+        self.visual = x11.XDefaultVisual(self.display, self.screen)
+        self.depth = x11.XDefaultDepth(self.display, self.screen)
+        # (w, h) -> (ximage, seginfo, numpy 视图)
+        self.images = {}
+
+    def _image(self, w, h):
+        entry = self.images.get((w, h))
+        if entry is not None:
+            return entry
+        seg = _XShmSegmentInfo()
+        img = self.xext.XShmCreateImage(self.display, self.visual, self.depth, self.ZPIXMAP,
+                                        None, ctypes.byref(seg), w, h)
+        if not img or img.contents.bits_per_pixel != 32:
+            raise RuntimeError("unsupported X visual (need 32 bits per pixel)")
+        bpl = img.contents.bytes_per_line
+        size = bpl * h
+        seg.shmid = self.libc.shmget(self.IPC_PRIVATE, size, self.IPC_CREAT | 0o600)
+        if seg.shmid < 0:
+            raise RuntimeError(f"shmget failed (errno {ctypes.get_errno()})")
+        seg.shmaddr = self.libc.shmat(seg.shmid, None, 0)
+        seg.readOnly = 0
+        img.contents.data = seg.shmaddr
+        self.xext.XShmAttach(self.display, ctypes.byref(seg))
+        self.x11.XSync(self.display, 0)
+        # 标记删除: 双方 detach 后由内核回收
+        self.libc.shmctl(seg.shmid, self.IPC_RMID, None)
+        buf = (ctypes.c_ubyte * size).from_address(seg.shmaddr)
+        view = np.frombuffer(buf, dtype=np.uint8).reshape(h, bpl // 4, 4)[:, :w]
+        entry = self.images[(w, h)] = (img, seg, view)
+        return entry
+
+    def grab(self, region):
+        x, y, w, h = (int(v) for v in region)
+        img, _, view = self._image(w, h)
+        if not self.xext.XShmGetImage(self.display, self.root, img, x, y, self.ALL_PLANES):
+            raise RuntimeError("XShmGetImage failed")
+        return view
+
+    def monitors(self):
+        # 单个 X screen 覆盖所有显示器
+        return [(0, 0, self.x11.XDisplayWidth(self.display, self.screen),
+                 self.x11.XDisplayHeight(self.display, self.screen))]
+
+    def close(self):
+        for img, seg, _ in self.images.values():
+            self.xext.XShmDetach(self.display, ctypes.byref(seg))
+            self.libc.shmdt(seg.shmaddr)
+        self.images = {}
+        if self.display:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+
+class MemoryBackend(CaptureBackend):
+    """
+    内存虚拟帧缓冲 (测试 / 基准 / 负载生成用)
+    set_frames() 登记的区域按调用轮换返回各变体；其它区域从虚拟屏幕 screen 上裁剪
+    """
+    name = "memory"
+    shared = True
+
+    def __init__(self, width=1920, height=1080):
+        self.screen = np.zeros((height, width, 4), dtype=np.uint8)
+        self.frames = {}
+        self.cursor = {}
+        self.lock = threading.Lock()
+
+    def set_frames(self, region, frames):
+        """frames: BGR 或 BGRA 图像列表"""
+        bgra = [f if f.shape[2] == 4 else cv2.cvtColor(f, cv2.COLOR_BGR2BGRA) for f in frames]
+        with self.lock:
+            self.frames[tuple(int(v) for v in region)] = bgra
+            self.cursor.pop(tuple(int(v) for v in region), None)
+
+    def clear(self):
+        with self.lock:
+            self.frames = {}
+            self.cursor = {}
+
+    def grab(self, region):
+        key = tuple(int(v) for v in region)
+        with self.lock:
+            variants = self.frames.get(key)
+            if variants:
+                idx = self.cursor.get(key, 0)
+                self.cursor[key] = (idx + 1) % len(variants)
+                return variants[idx]
+        x, y, w, h = key
+        crop = self.screen[y:y + h, x:x + w]
+        if crop.shape[0] != h or crop.shape[1] != w:
+            raise ValueError(f"region {key} outside virtual screen")
+        return crop
+
+    def monitors(self):
+        h, w = self.screen.shape[:2]
+        return [(0, 0, w, h)]
+
+
+BACKENDS = {
+    "mss": MssBackend,
+    "xshm": XShmBackend,
+    "memory": MemoryBackend,
+}
+
+# config.json 可选的后端；memory 只能由测试工具连同实例一起传给 set_capture_backend()
+CONFIG_BACKENDS = ("mss", "xshm")
+
+
+def create_backend(name):
+    cls = BACKENDS.get(name)
+    if cls is None:
+        raise ValueError(f"unknown capture backend: {name}")
+    return cls()
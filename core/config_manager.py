@@ -30,6 +30,16 @@ DEFAULT_CONFIG = {
         "location": 0.85 # 新增：位置匹配阈值
     },
     "webhook_url": "",
+    "metrics_port": 0, # 本地指标端口 (Prometheus /metrics + /metrics.json)，0 表示关闭
+    "vision_workers": 0, # 匹配工作进程数 (共享内存传帧)，0 表示在扫描线程内匹配
+    "capture_thread": False, # 后台抓图线程 (每个显示器一个，双缓冲)，匹配不再等待截图
+    "capture_backend": "mss", # 截图后端: mss / xshm (Linux X11 共享内存)；其它值回退到 mss
+    "extra_scales": [], # 额外支持的 UI 缩放 (如 [110, 150])，模板由 100% 母版重采样生成
+    "detection_engine": "template", # Local/Overview 检测引擎: template (整幅滑动匹配) / rows (按行取图标小块分类)
+    "cycle_budget_ms": 0, # 每周期时间预算 (ms)，超出时 Monster/Probe/Location 跨周期轮转扫描；0 表示取 scan_interval
+    "quality_governor": True, # 周期耗时 / CPU 超预算时逐级降低扫描质量，有余量时自动恢复 (每次变化写入日志)
+    "cpu_budget_pct": 0, # 进程 CPU 占用预算 (%，可超过 100 表示多核)，0 表示只看周期耗时
+    "location_engine": "glyphs", # 位置识别: glyphs (切字形分类 + 星系名单校正) / templates (逐个星系整图匹配)
     "audio_paths": {
         "local": "assets/sounds/01.wav",
         "overview": "assets/sounds/02.wav",
@@ -43,6 +53,8 @@ DEFAULT_CONFIG = {
 class ConfigManager:
     def __init__(self):
         self.config = DEFAULT_CONFIG.copy()
+        # 配置变化回调 fn(key, value)，在调用 set() 的线程上执行
+        self.listeners = []
         self.load()
 
     def load(self):
@@ -88,6 +100,18 @@ class ConfigManager:
     def set(self, key, value):
         self.config[key] = value
         self.save()
+        for fn in list(self.listeners):
+            try:
+                fn(key, value)
+            except Exception:
+                pass
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self.listeners:
+            self.listeners.remove(fn)
 
     def get_audio_path(self, key):
         raw_path = self.config.get("audio_paths", {}).get(key, "")
@@ -0,0 +1,104 @@
+import time
+
+
+class QualityGovernor:
+    """
+    周期超时看门狗 + CPU 调节: 跟踪周期耗时与进程 CPU 占用 (指数滑动平均)，与预算比较后逐级降低/恢复扫描质量
+    连续 DOWN_CYCLES 个周期超预算降一级；连续 UP_CYCLES 个周期低于预算的 HEADROOM 倍升一级
+    各级效果累加:
+        1 跳过位置识别
+        2 金字塔半分辨率预过滤用于更小的区域 (PYRAMID_MIN_AREA 降为 REDUCED_PYRAMID_AREA，经 tunables() 转发给进程池)
+        3 Monster / Probe 扫描间隔放宽为 REDUCED_CADENCE 个 scan_interval
+    """
+    LEVELS = ("full quality", "skip location", "half-res prefilter", "reduced monster/probe cadence")
+
+    def __init__(self, vision, scheduler, metrics, alpha=0.3):
+        self.vision = vision
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.alpha = alpha
+        self.DOWN_CYCLES = 3
+        self.UP_CYCLES = 10
+        self.HEADROOM = 0.6
+        self.REDUCED_PYRAMID_AREA = 20000
+        self.REDUCED_CADENCE = 4
+        self.base = None
+        self.reset()
+
+    def reset(self):
+        """恢复全质量 (启动监控时调用)"""
+        if self.base is not None:
+            self._apply(0, 0.5)
+        self.level = 0
+        self.cycle_ms = None
+        self.cpu_pct = None
+        self.over = 0
+        self.under = 0
+        self.cpu_mark = None
+        self.metrics.set_gauge("quality_level", 0)
+
+    def _ewma(self, prev, value):
+        return value if prev is None else prev + self.alpha * (value - prev)
+
+    def _sample_cpu(self):
+        """上次调用以来本进程 (所有线程) 的 CPU 占用百分比"""
+        mark = (time.process_time(), time.perf_counter())
+        prev, self.cpu_mark = self.cpu_mark, mark
+        if prev is None or mark[1] <= prev[1]:
+            return None
+        return 100.0 * (mark[0] - prev[0]) / (mark[1] - prev[1])
+
+    def update(self, cycle_ms, budget_ms, cpu_budget_pct, scan_interval):
+        """
+        每个周期结束时调用；cpu_budget_pct 为 0 表示不限 CPU
+        级别变化时返回描述字符串 (供日志输出)，否则返回 None
+        """
+        self.cycle_ms = self._ewma(self.cycle_ms, cycle_ms)
+        cpu = self._sample_cpu()
+        if cpu is not None:
+            self.cpu_pct = self._ewma(self.cpu_pct, cpu)
+            self.metrics.set_gauge("process_cpu_pct", round(self.cpu_pct, 1))
+        cpu_pct = self.cpu_pct or 0.0
+
+        over = self.cycle_ms > budget_ms or (cpu_budget_pct > 0 and cpu_pct > cpu_budget_pct)
+        idle = self.cycle_ms < budget_ms * self.HEADROOM and \
+            (cpu_budget_pct <= 0 or cpu_pct < cpu_budget_pct * self.HEADROOM)
+        self.over = self.over + 1 if over else 0
+        self.under = self.under + 1 if idle else 0
+
+        level = self.level
+        if self.over >= self.DOWN_CYCLES and level < len(self.LEVELS) - 1:
+            level += 1
+        elif self.under >= self.UP_CYCLES and level > 0:
+            level -= 1
+        if level == self.level:
+            return None
+
+        old = self.level
+        self._apply(level, scan_interval)
+        self.over = self.under = 0
+        self.metrics.set_gauge("quality_level", level)
+        self.metrics.inc("quality_level_changes", {"direction": "down" if level > old else "up"})
+        return (f"Quality {old} -> {level} ({self.LEVELS[level]}): cycle {self.cycle_ms:.0f}ms / budget {budget_ms:.0f}ms, "
+                f"CPU {cpu_pct:.0f}%" + (f" / {cpu_budget_pct:.0f}%" if cpu_budget_pct > 0 else ""))
+
+    def tunables(self):
+        """调节器会修改的引擎参数的当前值 (级别变化后转发给进程池工作进程)"""
+        return {"PYRAMID_MIN_AREA": self.vision.PYRAMID_MIN_AREA}
+
+    def _apply(self, level, scan_interval):
+        if self.base is None:
+            self.base = {"pyramid_area": self.vision.PYRAMID_MIN_AREA,
+                         "periods": dict(self.scheduler.PERIODS)}
+        self.level = level
+        periods = dict(self.base["periods"])
+        if level >= 1:
+            self.scheduler.DISABLED.add("location")
+        else:
+            self.scheduler.DISABLED.discard("location")
+        self.vision.PYRAMID_MIN_AREA = min(self.base["pyramid_area"], self.REDUCED_PYRAMID_AREA) \
+            if level >= 2 else self.base["pyramid_area"]
+        if level >= 3:
+            for region in ("monster", "probe"):
+                periods[region] = max(periods.get(region, 0.0), self.REDUCED_CADENCE * scan_interval)
+        self.scheduler.PERIODS = periods
@@ -0,0 +1,212 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图分桶上限 (毫秒)
+BUCKETS_MS = [0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        idx = len(BUCKETS_MS)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        # 桶内线性插值的近似分位数
+        if self.total == 0:
+            return 0.0
+        target = q * self.total
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+            if c and seen + c >= target:
+                return min(lower + (upper - lower) * (target - seen) / c, self.max_ms)
+            seen += c
+            lower = upper
+        return self.max_ms
+
+
+class Metrics:
+    """
+    各阶段耗时直方图 (按 阶段/客户端/区域 分组) 与计数器
+    VisionEngine 内部的计时通过 labels() 设置的线程局部标签归属到客户端/区域
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.local = threading.local()
+        self.started = time.time()
+
+    @contextmanager
+    def labels(self, client="", region=""):
+        prev = getattr(self.local, "labels", ("", ""))
+        self.local.labels = (client, region)
+        try:
+            yield
+        finally:
+            self.local.labels = prev
+
+    def current_labels(self):
+        return getattr(self.local, "labels", ("", ""))
+
+    def observe(self, stage, ms, client=None, region=None):
+        if client is None or region is None:
+            cur_client, cur_region = self.current_labels()
+            client = cur_client if client is None else client
+            region = cur_region if region is None else region
+        key = (stage, client, region)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(ms)
+
+    @contextmanager
+    def timer(self, stage, client=None, region=None):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - t0) * 1000.0, client, region)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            stages = []
+            for (stage, client, region), h in sorted(self.histograms.items()):
+                stages.append({
+                    "stage": stage,
+                    "client": client,
+                    "region": region,
+                    "count": h.total,
+                    "sum_ms": round(h.sum_ms, 3),
+                    "mean_ms": round(h.sum_ms / h.total, 3) if h.total else 0.0,
+                    "p50_ms": round(h.percentile(0.50), 3),
+                    "p95_ms": round(h.percentile(0.95), 3),
+                    "max_ms": round(h.max_ms, 3),
+                })
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())]
+            gauges = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.gauges.items())]
+        return {"uptime_s": round(time.time() - self.started, 1), "stages": stages,
+                "counters": counters, "gauges": gauges}
+
+    def prometheus_text(self):
+        def fmt_labels(pairs):
+            body = ",".join(f'{k}="{v}"' for k, v in pairs)
+            return "{" + body + "}" if body else ""
+
+        lines = [
+            "# HELP ews_stage_latency_seconds Per-stage latency of the scan loop.",
+            "# TYPE ews_stage_latency_seconds histogram",
+        ]
+        with self.lock:
+            for (stage, client, region), h in sorted(self.histograms.items()):
+                base = [("stage", stage), ("client", client), ("region", region)]
+                cumulative = 0
+                for i, bound in enumerate(BUCKETS_MS):
+                    cumulative += h.counts[i]
+                    le = fmt_labels(base + [("le", f"{bound / 1000.0:g}")])
+                    lines.append(f"ews_stage_latency_seconds_bucket{le} {cumulative}")
+                cumulative += h.counts[-1]
+                lines.append(f"ews_stage_latency_seconds_bucket{fmt_labels(base + [('le', '+Inf')])} {cumulative}")
+                lines.append(f"ews_stage_latency_seconds_sum{fmt_labels(base)} {h.sum_ms / 1000.0:.6f}")
+                lines.append(f"ews_stage_latency_seconds_count{fmt_labels(base)} {h.total}")
+
+            names = sorted({n for n, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE ews_{name}_total counter")
+                for (n, l), v in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"ews_{name}_total{fmt_labels(l)} {v}")
+
+            names = sorted({n for n, _ in self.gauges})
+            for name in names:
+                lines.append(f"# TYPE ews_{name} gauge")
+                for (n, l), v in sorted(self.gauges.items()):
+                    if n == name:
+                        lines.append(f"ews_{name}{fmt_labels(l)} {v}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """本地 HTTP 端点: /metrics (Prometheus 文本格式), /metrics.json (JSON 快照)"""
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = metrics.prometheus_text().encode("utf-8")
+                    ctype = "text/plain; version=0.0.4; charset=utf-8"
+                elif path in ("/metrics.json", "/snapshot"):
+                    body = json.dumps(metrics.snapshot(), indent=2).encode("utf-8")
+                    ctype = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
@@ -0,0 +1,147 @@
+import os
+import io
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from datetime import datetime
+
+SIGNAL_FILE = "profile.request"
+OUTPUT_DIR = "profiles"
+
+
+class StackSampler:
+    """采样指定线程的调用栈，输出 flamegraph 兼容的折叠栈 (func;func;func count)"""
+    def __init__(self, thread_id, interval=0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.sampling = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while self.running:
+            if self.sampling:
+                frame = sys._current_frames().get(self.thread_id)
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if parts:
+                    key = ";".join(reversed(parts))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def folded(self):
+        return "\n".join(f"{k} {v}" for k, v in sorted(self.stacks.items())) + "\n"
+
+
+class ScanProfiler:
+    """
+    按需剖析扫描循环的接下来 N 个周期
+    触发方式: request(n) (设置窗口按钮) 或在工作目录放置 profile.request 文件 (内容可写周期数)
+    输出: profiles/scan_<时间>.pstats / .txt (排序统计 + 模板耗时) / .folded (折叠栈)
+    """
+    def __init__(self, vision_engine, default_cycles=20):
+        self.vision = vision_engine
+        self.default_cycles = default_cycles
+        self.lock = threading.Lock()
+        self.requested = 0
+        self.cycles_left = 0
+        self.profile = None
+        self.sampler = None
+        self.started_at = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def request(self, cycles=None):
+        with self.lock:
+            self.requested = int(cycles or self.default_cycles)
+
+    def poll_signal_file(self):
+        if not os.path.exists(SIGNAL_FILE):
+            return
+        cycles = None
+        try:
+            with open(SIGNAL_FILE, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+            if text:
+                cycles = int(text)
+        except Exception:
+            pass
+        try:
+            os.remove(SIGNAL_FILE)
+        except OSError:
+            pass
+        self.request(cycles)
+
+    def begin_cycle(self):
+        """在扫描线程中、每个周期开始时调用"""
+        self.poll_signal_file()
+        if self.profile is None:
+            with self.lock:
+                if not self.requested:
+                    return
+                self.cycles_left = self.requested
+                self.requested = 0
+            self.profile = cProfile.Profile()
+            self.sampler = StackSampler(threading.get_ident())
+            self.sampler.start()
+            self.vision.template_timing = {}
+            self.started_at = datetime.now()
+        self.sampler.sampling = True
+        self.profile.enable()
+
+    def end_cycle(self):
+        """周期结束时调用；完成全部 N 个周期后写盘并返回输出路径前缀，否则返回 None"""
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        self.sampler.sampling = False
+        self.cycles_left -= 1
+        if self.cycles_left > 0:
+            return None
+        return self._finish()
+
+    def _finish(self):
+        self.sampler.stop()
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        prefix = os.path.join(OUTPUT_DIR, "scan_" + self.started_at.strftime("%Y%m%d_%H%M%S"))
+
+        self.profile.dump_stats(prefix + ".pstats")
+
+        buf = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=buf)
+        stats.sort_stats("cumulative").print_stats(60)
+        stats.sort_stats("tottime").print_stats(30)
+
+        timing = self.vision.template_timing or {}
+        buf.write("\nPer-template matchTemplate time (sorted by total):\n")
+        buf.write(f"{'template':<40}{'calls':>8}{'total ms':>12}{'mean ms':>10}\n")
+        for label, (calls, total) in sorted(timing.items(), key=lambda kv: -kv[1][1]):
+            buf.write(f"{label:<40}{calls:>8}{total * 1000.0:>12.2f}{total * 1000.0 / calls:>10.3f}\n")
+
+        with open(prefix + ".txt", 'w', encoding='utf-8') as f:
+            f.write(buf.getvalue())
+        with open(prefix + ".folded", 'w', encoding='utf-8') as f:
+            f.write(self.sampler.folded())
+
+        self.vision.template_timing = None
+        self.profile = None
+        self.sampler = None
+        return prefix
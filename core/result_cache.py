@@ -0,0 +1,60 @@
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def frame_digest(img):
+    """画面内容摘要 (尺寸 + 像素)，内容相同的帧得到相同的键"""
+    img = np.ascontiguousarray(img)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(img.shape).encode("ascii"))
+    h.update(memoryview(img).cast("B"))
+    return h.digest()
+
+
+class ResultCache:
+    """
+    按内容寻址的匹配结果 LRU 缓存，所有客户端共用
+    同时受条目数与估算内存上限约束；命中/未命中计入 Metrics
+    """
+    def __init__(self, metrics, max_entries=512, max_bytes=1024 * 1024):
+        self.metrics = metrics
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    @staticmethod
+    def _size(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + sum(sys.getsizeof(v) for v in key + value)
+
+    def get(self, key, kind):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+        self.metrics.inc("result_cache_hits" if value is not None else "result_cache_misses", {"kind": kind})
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(key, old)
+            self.entries[key] = value
+            self.bytes += self._size(key, value)
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                old_key, old_value = self.entries.popitem(last=False)
+                self.bytes -= self._size(old_key, old_value)
+            count = len(self.entries)
+        self.metrics.set_gauge("result_cache_entries", count)
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.bytes = 0
+        self.metrics.set_gauge("result_cache_entries", 0)
@@ -0,0 +1,83 @@
+import time
+
+
+class ScanScheduler:
+    """
+    按周期时间预算挑选每个客户端本周期扫描的区域
+    Local / Overview 每个周期都扫描；Monster / Probe / Location 按上次扫描时间从旧到新轮转，
+    按各 (客户端, 区域) 的耗时估计 (抓图 + 匹配的指数滑动平均) 放入预算，放不下的顺延到后面的周期
+    每个周期至少放入一个可选区域，任何区域都不会被饿死
+    PERIODS: 可选区域的最短扫描间隔 (秒)；DISABLED: 暂停扫描的可选区域 (均可由质量调节器修改)
+    """
+    REQUIRED = ("local", "overview")
+    OPTIONAL = ("monster", "probe", "location")
+
+    def __init__(self, metrics, alpha=0.3):
+        self.metrics = metrics
+        self.alpha = alpha
+        self.PERIODS = {"location": 3.0}
+        self.DISABLED = set()
+        self.reset()
+
+    def reset(self):
+        # (client_id, region) -> 耗时估计 ms / 上次扫描时间 (perf_counter)
+        self.cost = {}
+        self.last_scan = {}
+        self.spent = {}
+
+    def due(self, client_id, region, now):
+        if region in self.DISABLED:
+            return False
+        period = self.PERIODS.get(region, 0.0)
+        last = self.last_scan.get((client_id, region))
+        return last is None or now - last >= period
+
+    def plan(self, clients, budget_ms, now=None):
+        """clients: client_id 列表；budget_ms <= 0 表示不限预算。返回 {client_id: 本周期扫描的区域集合}"""
+        now = time.perf_counter() if now is None else now
+        plan = {c: set(self.REQUIRED) for c in clients}
+        spent = sum(self.cost.get((c, r), 0.0) for c in clients for r in self.REQUIRED)
+        tasks = [(c, r) for c in clients for r in self.OPTIONAL if self.due(c, r, now)]
+        tasks.sort(key=lambda t: self.last_scan.get(t, float("-inf")))
+        placed = 0
+        for client_id, region in tasks:
+            est = self.cost.get((client_id, region), 0.0)
+            if budget_ms > 0 and placed and spent + est > budget_ms:
+                self.metrics.inc("scan_deferred", {"region": region})
+                continue
+            plan[client_id].add(region)
+            spent += est
+            placed += 1
+        self.metrics.set_gauge("scan_planned_ms", round(spent, 3))
+        return plan
+
+    def observe(self, client_id, region, ms):
+        """本周期 (客户端, 区域) 的实际耗时，可多次累加 (抓图、匹配分别计入)"""
+        key = (client_id, region)
+        self.spent[key] = self.spent.get(key, 0.0) + ms
+
+    def commit(self, plan, now=None):
+        """
+        周期结束: 更新耗时估计与扫描时间，并上报陈旧度 —— 每个 (客户端, 区域) 在本次刷新前 (或至今仍未刷新) 的数据年龄
+        gauge scan_staleness_seconds 为当前值，直方图 scan_age 为各次刷新时的年龄分布
+        """
+        now = time.perf_counter() if now is None else now
+        for client_id, regions in plan.items():
+            for region in self.REQUIRED + self.OPTIONAL:
+                key = (client_id, region)
+                last = self.last_scan.get(key)
+                scanned = region in regions and key in self.spent
+                if last is not None:
+                    age = now - last
+                    self.metrics.set_gauge("scan_staleness_seconds", round(age, 3),
+                                           {"client": client_id, "region": region})
+                    if scanned:
+                        self.metrics.observe("scan_age", age * 1000.0, client_id, region)
+                if not scanned:
+                    # 顺延，或计划内但未扫描 (缩放检测失败等)
+                    continue
+                ms = self.spent[key]
+                prev = self.cost.get(key)
+                self.cost[key] = ms if prev is None else prev + self.alpha * (ms - prev)
+                self.last_scan[key] = now
+        self.spent = {}
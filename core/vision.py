@@ -1,10 +1,42 @@
 import cv2
 import numpy as np
-import mss
 import os
+import io
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import Metrics
+from core.capture_backends import create_backend
+from core.result_cache import ResultCache, frame_digest
+
+
+class TemplateBank(list):
+    """
+    模板列表 (元素仍为 (processed, mask, name) 元组)，附带加载期计算的聚类信息
+    rep[i]: 模板 i 所在簇的代表模板下标；rep_sim[i]: 模板 i 与代表的相似度 (TM_CCOEFF_NORMED)
+    """
+    def __init__(self, items=(), type_key=None):
+        super().__init__(items)
+        self.type_key = type_key
+        self.rep = list(range(len(self)))
+        self.rep_sim = [1.0] * len(self)
+        # 半分辨率模板 (金字塔粗匹配用)，按需生成: (half_tmpl, half_mask) 或 False 表示不适用
+        self.half = [None] * len(self)
+        # SEA 预过滤用的模板分块能量，按需计算: (分块能量列表, 总能量) 或 False 表示不适用
+        self.sea = [None] * len(self)
+        # 行分类引擎用的归一化模板矩阵分组，按需生成 (见 VisionEngine._row_groups)
+        self.rows = None
+
+    @property
+    def cluster_count(self):
+        return len(set(self.rep))
+
 
 class VisionEngine:
-    def __init__(self):
+    def __init__(self, autoload=True):
         # 模板库结构: { "local": { "90": [], "100": [], "125": [] }, ... }
         self.templates = {
             "local": {},
@@ -15,7 +47,14 @@ class VisionEngine:
             "scaling": {} 
         }
         
-        self.SCALES = ["90", "100", "125"]
+        self.BASE_SCALES = ["90", "100", "125"]
+        # 额外支持的 UI 缩放 (如 "110", "150")，模板全部由 100% 母版重采样生成
+        self.EXTRA_SCALES = []
+        self.SCALES = list(self.BASE_SCALES)
+        # 某缩放目录缺失/为空时，由 100% 母版按比例重采样生成该缩放的模板
+        self.SYNTHESIZE_SCALES = True
+        # 编译后的模板库缓存 (按素材文件 mtime/大小 与处理参数校验)，None 表示不缓存
+        self.TEMPLATE_CACHE = "template_cache.npz"
         self.template_status_msg = "初始化中..."
         self.last_screenshot_shape = "无"
         self.last_error = None
@@ -28,38 +67,260 @@ class VisionEngine:
         self.BLUE_LOWER = np.array([95, 40, 40])
         self.BLUE_UPPER = np.array([135, 255, 255])
         self.SAFE_COLOR_THRESHOLD = 8 
+        
+        # 有无 mask 得分差异低于此值时丢弃 mask
+        self.MASK_SCORE_TOLERANCE = 0.01
+        
+        # 近似模板聚类: 相似度不低于此值的同尺寸模板归为一簇，先匹配代表模板
+        self.CLUSTER_TEMPLATES = True
+        self.CLUSTER_SIMILARITY = 0.9
+        self.CLUSTER_TYPES = ("local", "overview", "monster", "probe")
+        
+        # 图标列 ROI 收窄: 按 (客户端, 区域) 从确认命中学习图标所在列，之后只扫描该列
+        # 图标列以外的画面与上一帧相比变化超过 ROI_CHANGE_DELTA (1/4 缩略图上的最大灰度差) 时整宽扫描:
+        # 列表内容或列位置变了 (如调整了总览列顺序)，命中可能落在学到的列之外
+        self.ROI_NARROWING = True
+        self.ROI_TYPES = ("local", "overview")
+        self.ROI_MARGIN = 6
+        self.ROI_FULL_SCAN_EVERY = 20
+        self.ROI_CHANGE_DELTA = 8
+        self.roi_state = {}
+        
+        # 金字塔粗到细匹配: 大区域先在半分辨率上用放宽阈值找候选，再在候选窗口内全分辨率验证
+        self.PYRAMID_MATCHING = True
+        self.PYRAMID_MIN_AREA = 200000
+        self.PYRAMID_MIN_TEMPLATE = 14
+        self.PYRAMID_RELAX = 0.25
+        
+        # 逐次消除 (SEA) 预过滤: 由处理后画面的窗口/分块和与平方和 (box filter) 及模板分块能量，
+        # 按分块 Cauchy-Schwarz 不等式求每个位置 TM_CCOEFF_NORMED 的上界，只在上界达到阈值的位置精确匹配
+        # 只用于无 mask 模板；SEA_MARGIN 吸收 float32 误差；存活位置超过 SEA_MAX_KEEP 时直接整幅匹配
+        # 现有图标模板很小 (12~25px)，上界图的逐像素计算比 OpenCV 的 DFT 匹配还慢，默认关闭 (见 bench_vision --sea)
+        self.SEA_PREFILTER = False
+        self.SEA_TYPES = ("local", "overview")
+        self.SEA_GRID = 4
+        self.SEA_MARGIN = 0.02
+        self.SEA_MAX_KEEP = 0.3
+        
+        # 检测引擎: "template" 为整幅滑动匹配；"rows" 对 Local/Overview 列表先找出图标列与有内容的行，
+        # 只在这些行的图标位置附近 (±ROW_JITTER 像素) 取小块，与整个模板库做向量化归一化相关 (一次矩阵乘)
+        # 预处理后亮度高于本帧背景 (中位数) ROW_INK_DELTA 视为图标/文字: 阈值随画面变化，半透明窗口遮挡变暗的图标仍能找到图标列
+        # ROW_MIN_INK: 图标列左边界要求的最少像素数 (过滤噪点)
+        self.DETECTION_ENGINE = "template"
+        self.ROW_TYPES = ("local", "overview")
+        self.ROW_JITTER = 2
+        self.ROW_INK_DELTA = 25
+        self.ROW_MIN_INK = 3
+
+        # 位置识别引擎: "glyphs" 把二值化位置栏按连通域 + 列投影切成单个字形，与各缩放由 assets/location 素材
+        # 自举出的字形库 (只含素材文件名里出现过的字符) 做最近邻分类，再按星系名单 (素材文件名) 补全至多
+        # LOCATION_MAX_EDITS 个低分字形 ('?')，耗时与星系数量无关；"templates" 为逐个星系整图匹配
+        # 高分字形与名单不符时不做校正 (名单外的星系不会被报成相近的名字)；平均字形分数同样要求 >= threshold
+        # 字形库为空、读不出名单内的名字、或分数不足时回退整图匹配 (LOCATION_TEMPLATE_FALLBACK)
+        self.LOCATION_ENGINE = "glyphs"
+        self.LOCATION_TEMPLATE_FALLBACK = True
+        self.LOCATION_MAX_EDITS = 1
+        self.GLYPH_SIZE = (12, 20)
+        self.GLYPH_MIN_SCORE = 0.7
+        # 宽于 字高 * GLYPH_SPLIT_RATIO 的字形块 (粘连字符) 尝试在中部墨迹最少的列拆成两个
+        # 字形间隔宽于 字高 * GLYPH_SPACE_RATIO 视为词间空格
+        self.GLYPH_SPLIT_RATIO = 1.4
+        self.GLYPH_SPACE_RATIO = 0.6
+        self.glyph_sets = {}
+        self.system_names = set()
+        self.system_names_by_len = {}
+
+        # 命中跟踪: 画面未变化时只在已确认命中框附近小窗口复核，整区域搜索降频
+        self.TRACK_HITS = True
+        self.TRACK_TYPES = ("local", "overview")
+        self.TRACK_MARGIN = 3
+        self.TRACK_FULL_SCAN_EVERY = 10
+        self.TRACK_CHANGE_DELTA = 8
+        self.track_state = {}
+        
+        # 分块并行匹配: 很高的区域 (1440p/4K 整列本地栏) 按得分图行切成 TILE_ROWS 行一块，
+        # 输入块之间重叠 模板高度-1 行，各块在线程池上匹配 (matchTemplate 释放 GIL)，写回同一张得分图
+        # 得分图各行只由一个块计算，计数仍在整张得分图上按 mask_map 中心规则去重
+        self.TILE_PARALLEL = True
+        self.TILE_ROWS = 512
+        self.TILE_WORKERS = min(4, os.cpu_count() or 1)
+        self.tile_executor = None
+        
+        # 截图后端 (mss / xshm / memory)；mss、Xlib 句柄不能跨线程，非共享后端按线程各建一个
+        # backend_fallback: 创建失败的后端名 -> 错误信息，之后各线程直接使用 mss，不再逐次重试
+        # backend_injected: 后端实例由调用方直接传入 (测试工具)，不按 config.json 切换
+        self.CAPTURE_BACKEND = "mss"
+        self.shared_backend = None
+        self.backend_fallback = {}
+        self.backend_injected = False
+        self.thread_backends = threading.local()
+        
+        # 预处理查找表: gamma 1.5 + TOZERO(30) / 位置二值化(180) 各合并为一张表，只计算一次
+        self.gamma_tables = {}
+        self.preprocess_lut = self._build_preprocess_lut()
+        self.location_lut = np.where(np.arange(256) > 180, 255, 0).astype(np.uint8)
+        # 按 (区域 key, 用途, 尺寸) 复用的灰度/预处理/得分图缓冲，避免每帧分配
+        # 区域尺寸变化时丢弃该区域的全部缓冲；buffer_bytes 为当前总占用
+        self.prep_buffers = {}
+        self.buffer_geometry = {}
+        self.buffer_bytes = 0
+        
+        # 各阶段耗时统计 (AlarmWorker 共用同一实例)
+        self.metrics = Metrics()
+        # 匹配结果缓存: 内容相同的帧 (多个客户端在同一星系 / 画面未变) 只匹配一次
+        self.RESULT_CACHE = True
+        self.result_cache = ResultCache(self.metrics)
+        # 拼图批量匹配: 多个客户端同缩放的同类区域拼成一张图，每个模板只调用一次 matchTemplate
+        # 只用于模板少、区域小的类型 (local/overview 逐帧匹配有金字塔/聚类/ROI，拼图反而更慢，见 bench_vision --mosaic)
+        self.MOSAIC_BATCH = True
+        self.MOSAIC_TYPES = ("monster", "probe")
+        self.MOSAIC_MIN_FRAMES = 2
+        
+        # 剖析期间按模板统计 matchTemplate 耗时: { label: [calls, seconds] }，None 表示关闭
+        self.template_timing = None
             
-        self.load_templates()
+        # autoload=False: 模板由调用方提供 (视觉进程池的工作进程从共享内存图集加载)
+        if autoload:
+            self.load_templates()
+
+    FOLDER_MAP = {
+        "local": "hostile_icons_local",
+        "overview": "hostile_icons_overview",
+        "monster": "monster_icons",
+        "probe": "probe_icons",
+        "location": "location", 
+        "scaling": "ui_scaling_adaptation"
+    }
+    TEMPLATE_CACHE_VERSION = 3
 
     def load_templates(self):
         base_dir = os.getcwd()
         assets_dir = os.path.join(base_dir, "assets")
         
-        folder_map = {
-            "local": "hostile_icons_local",
-            "overview": "hostile_icons_overview",
-            "monster": "monster_icons",
-            "probe": "probe_icons",
-            "location": "location", 
-            "scaling": "ui_scaling_adaptation"
-        }
-        
+        self.SCALES = sorted(set(self.BASE_SCALES) | set(self.EXTRA_SCALES), key=int)
         total_count = 0
+        cluster_count = 0
+        # 模板压缩统计: 裁剪透明边 / 走无 mask 快速路径 / 保留 mask / 由 100% 重采样生成
+        self.template_stats = {"cropped": 0, "unmasked": 0, "masked": 0, "synthesized": 0}
+        
+        signature = self._assets_signature(assets_dir)
+        compiled = self._read_template_cache(signature)
+        from_cache = compiled is not None
+        if compiled is None:
+            compiled = {}
+            for type_key, folder_name in self.FOLDER_MAP.items():
+                for scale in self.SCALES:
+                    path = os.path.join(assets_dir, folder_name, scale)
+                    imgs = self._load_images_from_folder(path, type_key)
+                    if not imgs and self.SYNTHESIZE_SCALES and scale != "100":
+                        master = os.path.join(assets_dir, folder_name, "100")
+                        imgs = self._load_images_from_folder(master, type_key, int(scale) / 100.0)
+                        self.template_stats["synthesized"] += len(imgs)
+                    compiled[(type_key, scale)] = imgs
+            self._write_template_cache(signature, compiled)
         
-        for type_key, folder_name in folder_map.items():
+        for type_key in self.FOLDER_MAP:
+            self.templates[type_key] = {}
             for scale in self.SCALES:
-                path = os.path.join(assets_dir, folder_name, scale)
-                imgs = self._load_images_from_folder(path, type_key)
+                imgs = TemplateBank(compiled.get((type_key, scale), []), type_key)
+                if self.CLUSTER_TEMPLATES and type_key in self.CLUSTER_TYPES:
+                    self._cluster_bank(imgs)
                 self.templates[type_key][scale] = imgs
                 total_count += len(imgs)
-        
+                cluster_count += imgs.cluster_count
+
+        self._load_system_names()
+        self.glyph_sets = {}
+        for scale in self.SCALES:
+            glyphs = self._build_glyph_set(self.templates["location"].get(scale, []))
+            if glyphs is not None:
+                self.glyph_sets[scale] = glyphs
+        glyph_chars = sorted(set().union(*(set(g["labels"]) for g in self.glyph_sets.values()))) \
+            if self.glyph_sets else []
+
         self.template_status_msg = (
             f"Assets Path: {assets_dir}\n"
             f"Scales Loaded: {', '.join(self.SCALES)}\n"
-            f"Total Templates: {total_count}"
+            f"Total Templates: {total_count} (synthesized {self.template_stats['synthesized']}"
+            f"{', from cache' if from_cache else ''})\n"
+            f"Fast Path (no mask): {self.template_stats['unmasked']} / {total_count} "
+            f"(cropped {self.template_stats['cropped']}, masked {self.template_stats['masked']})\n"
+            f"Distinct Shapes (clusters): {cluster_count}\n"
+            f"Location Glyphs: {len(glyph_chars)} chars, {len(self.system_names)} system names"
         )
+        self.template_stats["clusters"] = cluster_count
+        self.template_stats["from_cache"] = from_cache
+        self.result_cache.clear()
+
+    def _assets_signature(self, assets_dir):
+        """素材文件 (路径/大小/mtime) + 影响编译结果的参数的摘要，任一变化都使缓存失效"""
+        h = hashlib.sha1()
+        h.update(json.dumps([self.TEMPLATE_CACHE_VERSION, self.SCALES, self.SYNTHESIZE_SCALES,
+                             self.MASK_SCORE_TOLERANCE]).encode("utf-8"))
+        h.update(self.preprocess_lut.tobytes())
+        h.update(self.location_lut.tobytes())
+        for folder_name in self.FOLDER_MAP.values():
+            root = os.path.join(assets_dir, folder_name)
+            if not os.path.isdir(root):
+                continue
+            for dirpath, _, files in sorted(os.walk(root)):
+                for filename in sorted(files):
+                    st = os.stat(os.path.join(dirpath, filename))
+                    rel = os.path.relpath(os.path.join(dirpath, filename), assets_dir)
+                    h.update(f"{rel}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def _read_template_cache(self, signature):
+        if not self.TEMPLATE_CACHE or not os.path.exists(self.TEMPLATE_CACHE):
+            return None
+        try:
+            with np.load(self.TEMPLATE_CACHE, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("signature") != signature:
+                    return None
+                compiled = {}
+                for entry in meta["banks"]:
+                    items = []
+                    for i, name in enumerate(entry["names"]):
+                        prefix = f"{entry['type']}/{entry['scale']}/{i}"
+                        mask = data[prefix + "/m"] if prefix + "/m" in data.files else None
+                        items.append((data[prefix + "/t"], mask, name))
+                    compiled[(entry["type"], entry["scale"])] = items
+                self.template_stats.update(meta["stats"])
+                return compiled
+        except Exception:
+            return None
+
+    def _write_template_cache(self, signature, compiled):
+        if not self.TEMPLATE_CACHE:
+            return
+        arrays = {}
+        banks = []
+        for (type_key, scale), items in compiled.items():
+            banks.append({"type": type_key, "scale": scale, "names": [item[2] for item in items]})
+            for i, (tmpl, mask, _) in enumerate(items):
+                arrays[f"{type_key}/{scale}/{i}/t"] = tmpl
+                if mask is not None:
+                    arrays[f"{type_key}/{scale}/{i}/m"] = mask
+        meta = {"signature": signature, "banks": banks, "stats": self.template_stats}
+        try:
+            buf = io.BytesIO()
+            np.savez(buf, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+            tmp_path = self.TEMPLATE_CACHE + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(buf.getvalue())
+            os.replace(tmp_path, self.TEMPLATE_CACHE)
+        except Exception:
+            pass
+
+    def _resample(self, img, factor):
+        h, w = img.shape[:2]
+        size = (max(1, int(round(w * factor))), max(1, int(round(h * factor))))
+        interp = cv2.INTER_AREA if factor < 1.0 else cv2.INTER_LINEAR
+        return cv2.resize(img, size, interpolation=interp)
 
-    def _load_images_from_folder(self, folder, type_key):
+    def _load_images_from_folder(self, folder, type_key, resample=None):
+        """resample: 非 None 时先把原图 (含 alpha) 按该比例重采样，再走相同的裁剪/预处理流程"""
         templates = []
         if not os.path.exists(folder):
             return templates
@@ -69,61 +330,219 @@ class VisionEngine:
                 path = os.path.join(folder, filename)
                 try:
                     img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+                    if img is not None and resample is not None:
+                        img = self._resample(img, resample)
                     if img is not None:
                         if img.shape[2] == 4:
+                            img = self._crop_to_alpha(img)
+                            if img is None:
+                                continue
                             b, g, r, a = cv2.split(img)
                             gray = cv2.cvtColor(cv2.merge([b,g,r]), cv2.COLOR_BGR2GRAY)
                             
+                            name = os.path.splitext(filename)[0]
                             if type_key == "location":
                                 processed = self.preprocess_location(gray)
-                                name = os.path.splitext(filename)[0]
-                                templates.append((processed, a, name))
                             else:
                                 processed = self.preprocess_image(gray)
-                                templates.append((processed, a))
+                            mask = self._compact_mask(processed, a)
+                            templates.append((processed, mask, name))
                         else:
                             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
                             
+                            name = os.path.splitext(filename)[0]
                             if type_key == "location":
                                 processed = self.preprocess_location(gray)
-                                name = os.path.splitext(filename)[0]
-                                templates.append((processed, None, name))
                             else:
                                 processed = self.preprocess_image(gray)
-                                templates.append((processed, None))
+                            templates.append((processed, None, name))
+                            self.template_stats["unmasked"] += 1
                 except Exception:
                     pass
         return templates
 
+    def _cluster_bank(self, bank):
+        """
+        贪心聚类: 同尺寸、无 mask、非纯色的模板两两计算相似度，
+        与某代表相似度 >= CLUSTER_SIMILARITY 的并入该簇
+        """
+        reps = []
+        for i, (tmpl, mask, _) in enumerate(bank):
+            if mask is not None or tmpl.std() == 0:
+                continue
+            best, best_sim = None, -1.0
+            for r in reps:
+                other = bank[r][0]
+                if other.shape != tmpl.shape:
+                    continue
+                sim = float(cv2.matchTemplate(tmpl, other, cv2.TM_CCOEFF_NORMED)[0, 0])
+                if sim > best_sim:
+                    best, best_sim = r, sim
+            if best is not None and best_sim >= self.CLUSTER_SIMILARITY:
+                bank.rep[i] = best
+                bank.rep_sim[i] = min(best_sim, 1.0)
+            else:
+                reps.append(i)
+
+    def _cluster_gate(self, sim, threshold):
+        """
+        成员在某位置得分 >= threshold 时，代表在同一位置的得分下界:
+        两个归一化相关系数对应向量夹角，夹角满足三角不等式 -> cos(acos(t) + acos(sim))
+        """
+        angle = np.arccos(np.clip(threshold, -1.0, 1.0)) + np.arccos(np.clip(sim, -1.0, 1.0))
+        if angle >= np.pi / 2:
+            return None
+        return float(np.cos(angle)) - 0.01
+
+    def _crop_to_alpha(self, img):
+        """裁剪到 alpha 非零的包围盒，去掉透明边；全透明返回 None"""
+        alpha = img[:, :, 3]
+        ys, xs = np.nonzero(alpha)
+        if ys.size == 0:
+            return None
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        if (y0, x0) != (0, 0) or (y1, x1) != alpha.shape:
+            self.template_stats["cropped"] += 1
+            img = np.ascontiguousarray(img[y0:y1, x0:x1])
+        return img
+
+    def _compact_mask(self, processed, alpha):
+        """
+        判断 mask 是否会改变匹配分数；不会则丢弃 mask，走速度快得多的无 mask 匹配
+        全不透明直接丢弃；否则把模板贴到黑色 / 随机背景上，比较有无 mask 的得分图
+        """
+        if cv2.countNonZero(cv2.compare(alpha, 255, cv2.CMP_NE)) == 0:
+            self.template_stats["unmasked"] += 1
+            return None
+
+        h, w = processed.shape[:2]
+        rng = np.random.default_rng(0)
+        opaque = alpha > 0
+        for bg in (np.zeros((h + 8, w + 8), np.uint8),
+                   rng.integers(0, 256, (h + 8, w + 8), dtype=np.uint8)):
+            canvas = bg.copy()
+            window = canvas[4:4 + h, 4:4 + w]
+            window[opaque] = processed[opaque]
+            try:
+                res_masked = cv2.matchTemplate(canvas, processed, cv2.TM_CCOEFF_NORMED, mask=alpha)
+                res_plain = cv2.matchTemplate(canvas, processed, cv2.TM_CCOEFF_NORMED)
+            except Exception:
+                break
+            res_masked = np.nan_to_num(res_masked, nan=0.0, posinf=0.0, neginf=0.0)
+            res_plain = np.nan_to_num(res_plain, nan=0.0, posinf=0.0, neginf=0.0)
+            if np.max(np.abs(res_masked - res_plain)) > self.MASK_SCORE_TOLERANCE:
+                self.template_stats["masked"] += 1
+                return alpha
+        self.template_stats["unmasked"] += 1
+        return None
+
+    def _gamma_table(self, gamma):
+        table = self.gamma_tables.get(gamma)
+        if table is None:
+            invGamma = 1.0 / gamma
+            table = np.array([((i / 255.0) ** invGamma) * 255
+                for i in np.arange(0, 256)]).astype("uint8")
+            self.gamma_tables[gamma] = table
+        return table
+
+    def _build_preprocess_lut(self):
+        # 与 apply_gamma(1.5) + threshold(30, TOZERO) 逐像素等价
+        table = self._gamma_table(1.5)
+        return np.where(table > 30, table, 0).astype(np.uint8)
+
     def apply_gamma(self, image, gamma=1.0):
-        invGamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** invGamma) * 255
-            for i in np.arange(0, 256)]).astype("uint8")
-        return cv2.LUT(image, table)
+        return cv2.LUT(image, self._gamma_table(gamma))
+
+    def preprocess_image(self, gray_img, dst=None):
+        return cv2.LUT(gray_img, self.preprocess_lut, dst=dst)
 
-    def preprocess_image(self, gray_img):
-        gamma_corrected = self.apply_gamma(gray_img, gamma=1.5)
-        _, thresholded = cv2.threshold(gamma_corrected, 30, 255, cv2.THRESH_TOZERO)
-        return thresholded
+    def preprocess_location(self, gray_img, dst=None):
+        return cv2.LUT(gray_img, self.location_lut, dst=dst)
 
-    def preprocess_location(self, gray_img):
-        _, binary = cv2.threshold(gray_img, 180, 255, cv2.THRESH_BINARY)
-        return binary
+    def _buffer(self, key, name, shape, dtype=np.uint8):
+        """按 (key, 用途, 尺寸) 取可复用缓冲；key 为 None 时每次新分配"""
+        if key is None:
+            return np.empty(shape, dtype=dtype)
+        buf_key = (key, name, shape)
+        buf = self.prep_buffers.get(buf_key)
+        if buf is None or buf.dtype != dtype:
+            buf = self.prep_buffers[buf_key] = np.empty(shape, dtype=dtype)
+            self.buffer_bytes += buf.nbytes
+            self.metrics.set_gauge("scratch_buffer_bytes", self.buffer_bytes)
+        return buf
+
+    def _check_geometry(self, key, shape):
+        """区域尺寸变化 (重新框选 / 缩放) 时释放该区域的旧缓冲"""
+        if key is None or self.buffer_geometry.get(key) == shape:
+            return
+        for buf_key in [k for k in self.prep_buffers if k[0] == key]:
+            self.buffer_bytes -= self.prep_buffers.pop(buf_key).nbytes
+        self.buffer_geometry[key] = shape
+        self.metrics.set_gauge("scratch_buffer_bytes", self.buffer_bytes)
+
+    def _res_buffer(self, key, name, screen_shape, tmpl_shape):
+        shape = (screen_shape[0] - tmpl_shape[0] + 1, screen_shape[1] - tmpl_shape[1] + 1)
+        return self._buffer(key, name, shape, np.float32)
+
+    def frame_gray(self, screen_img, key=None):
+        return cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY, dst=self._buffer(key, "gray", screen_img.shape[:2]))
+
+    def set_capture_backend(self, name, backend=None):
+        """切换截图后端；backend 可直接传入实例 (如预先登记了帧的 MemoryBackend)"""
+        self.close_capture_backend()
+        if self.shared_backend is not None:
+            self.shared_backend.close()
+            self.shared_backend = None
+        self.CAPTURE_BACKEND = name
+        # 显式切换时重新尝试之前失败过的后端
+        self.backend_fallback.pop(name, None)
+        self.backend_injected = backend is not None
+        if backend is not None:
+            self.shared_backend = backend
+
+    def capture_backend(self):
+        """当前线程使用的后端实例；创建失败 (如没有 X 显示) 时回退到 mss，并记住回退直到下次 set_capture_backend()"""
+        if self.shared_backend is not None:
+            return self.shared_backend
+        name = "mss" if self.CAPTURE_BACKEND in self.backend_fallback else self.CAPTURE_BACKEND
+        backend = getattr(self.thread_backends, "backend", None)
+        if backend is not None and backend.name == name:
+            return backend
+        if backend is not None:
+            backend.close()
+        try:
+            backend = create_backend(name)
+        except Exception as e:
+            self.backend_fallback[name] = str(e)
+            self.last_error = f"Capture Backend Error ({name}): {str(e)}"
+            backend = create_backend("mss")
+        if backend.shared:
+            self.shared_backend = backend
+        else:
+            self.thread_backends.backend = backend
+        return backend
+
+    def close_capture_backend(self):
+        """释放当前线程的后端实例 (扫描线程退出时调用)"""
+        backend = getattr(self.thread_backends, "backend", None)
+        if backend is not None:
+            backend.close()
+            self.thread_backends.backend = None
 
     def capture_screen(self, region, debug_name=None):
         self.last_error = None
         if not region: 
             return None
         
-        monitor = {"top": int(region[1]), "left": int(region[0]), "width": int(region[2]), "height": int(region[3])}
-        
         try:
-            with mss.mss() as sct:
-                img = np.array(sct.grab(monitor))
-                img_bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-                h, w = img_bgr.shape[:2]
-                self.last_screenshot_shape = f"{w}x{h}"
-                return img_bgr
+            backend = self.capture_backend()
+            t0 = time.perf_counter()
+            img = backend.grab(region)
+            self.metrics.observe("grab", (time.perf_counter() - t0) * 1000.0, "", backend.name)
+            img_bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            h, w = img_bgr.shape[:2]
+            self.last_screenshot_shape = f"{w}x{h}"
+            return img_bgr
         except Exception as e:
             self.last_error = f"Screenshot Error: {str(e)}"
             return None
@@ -168,7 +587,7 @@ class VisionEngine:
                 best_scale = scale
         return best_scale
 
-    def match_location_name(self, screen_img, scale, threshold=0.85):
+    def match_location_name(self, screen_img, scale, threshold=0.85, key=None):
         if screen_img is None or not scale:
             return None, 0.0
             
@@ -176,18 +595,47 @@ class VisionEngine:
         if not tmpls:
             return None, 0.0
 
-        screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY)
-        screen_processed = self.preprocess_location(screen_gray)
+        cache_key = None
+        if self.RESULT_CACHE:
+            cache_key = ("location", frame_digest(screen_img), scale, float(threshold), self.LOCATION_ENGINE,
+                         self.LOCATION_TEMPLATE_FALLBACK)
+            cached = self.result_cache.get(cache_key, "location")
+            if cached is not None:
+                return cached
+        result = None
+        glyphs = self.glyph_sets.get(scale) if self.LOCATION_ENGINE == "glyphs" else None
+        if glyphs is not None:
+            result = self._read_location_name(screen_img, glyphs, threshold, key)
+            if result[0] is None and self.LOCATION_TEMPLATE_FALLBACK:
+                self.metrics.inc("location_glyph_fallback")
+                result = None
+        if result is None:
+            result = self._match_location_name(screen_img, tmpls, threshold, key)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+        return result
+
+    def _match_location_name(self, screen_img, tmpls, threshold, key):
+        self._check_geometry(key, screen_img.shape)
+        t0 = time.perf_counter()
+        screen_gray = self.frame_gray(screen_img, key)
+        screen_processed = self.preprocess_location(
+            screen_gray, dst=self._buffer(key, "processed", screen_gray.shape))
+        self.metrics.observe("preprocess", (time.perf_counter() - t0) * 1000.0)
         
         best_name = None
         best_score = 0.0
         
         for tmpl_processed, mask, name in tmpls:
             try:
+                dst = None
+                if screen_processed.shape[0] >= tmpl_processed.shape[0] and \
+                        screen_processed.shape[1] >= tmpl_processed.shape[1]:
+                    dst = self._res_buffer(key, "res", screen_processed.shape, tmpl_processed.shape)
                 if mask is not None:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, mask=mask)
+                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=dst, mask=mask)
                 else:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED)
+                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=dst)
                 
                 _, max_val, _, _ = cv2.minMaxLoc(res)
                 if np.isinf(max_val) or np.isnan(max_val): max_val = 0.0
@@ -203,69 +651,919 @@ class VisionEngine:
         else:
             return None, best_score
 
-    def count_matches(self, screen_img, template_list, threshold, check_safe_color=False):
+    def _load_system_names(self):
+        """星系名单: 各缩放位置素材的文件名"""
+        names = set()
+        for bank in self.templates["location"].values():
+            names.update(name for _, _, name in bank)
+        self.system_names = names
+        self.system_names_by_len = {}
+        for name in sorted(names):
+            self.system_names_by_len.setdefault(len(name), []).append(name)
+
+    def _glyph_segments(self, binary):
+        """
+        二值图切字形: 连通域按列范围重叠合并 (同一字符的多个部件)，返回 ([x0, x1, y0, y1] 列表, 字顶行, 字高)
+        字顶/字高取高度接近最高者的中位数，不受 '-' 等矮字形影响
+        """
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        boxes = sorted((x, x + w, y, y + h) for x, y, w, h, area in stats[1:] if area >= 2)
+        segs = []
+        for x0, x1, y0, y1 in boxes:
+            if segs and x0 < segs[-1][1]:
+                s = segs[-1]
+                segs[-1] = [s[0], max(s[1], x1), min(s[2], y0), max(s[3], y1)]
+            else:
+                segs.append([x0, x1, y0, y1])
+        if not segs:
+            return [], 0, 0
+        tallest = max(s[3] - s[2] for s in segs)
+        tall = [s for s in segs if s[3] - s[2] >= 0.7 * tallest]
+        top = int(np.median([s[2] for s in tall]))
+        bottom = int(np.median([s[3] for s in tall]))
+        return segs, top, max(1, bottom - top)
+
+    def _split_column(self, binary, x0, x1, top, cap_h):
+        """粘连字形的拆分列: 中部 (30%~70%) 墨迹最少的列"""
+        band = binary[top:top + int(round(cap_h * 1.3)), x0:x1]
+        ink = np.count_nonzero(band, axis=0)
+        lo, hi = int((x1 - x0) * 0.3), max(int((x1 - x0) * 0.7), int((x1 - x0) * 0.3) + 1)
+        return x0 + lo + int(np.argmin(ink[lo:hi]))
+
+    def _glyph_vector(self, binary, x0, x1, top, cap_h):
+        """
+        字形归一化: 取 字顶 ~ 1.3 倍字高 (含 Q 等的下伸部分) 的行，水平居中放进宽 1.4 倍字高的画布 (保留字宽信息)，
+        缩放到 GLYPH_SIZE 后去均值、单位化；空白返回 None
+        """
+        rows = int(round(cap_h * 1.3))
+        width = max(x1 - x0, int(round(cap_h * 1.4)))
+        canvas = np.zeros((rows, width), np.float32)
+        crop = binary[top:top + rows, x0:x1]
+        off = (width - (x1 - x0)) // 2
+        canvas[:crop.shape[0], off:off + crop.shape[1]] = crop
+        vec = cv2.resize(canvas, self.GLYPH_SIZE, interpolation=cv2.INTER_AREA).ravel()
+        vec -= vec.mean()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else None
+
+    def _build_glyph_set(self, bank):
+        """
+        由位置素材自举字形库: 去掉名字后的标记后，每张素材切出的字形块数等于名字长度时按顺序标注为名字的各字符，
+        名字后的标记标注为 '*' (识别时视为分隔)；块数不足时先拆最宽的粘连块。返回 {"matrix", "labels"} 或 None
+        """
+        vectors, labels = [], []
+        for processed, _, name in bank:
+            chars = [c for c in name if not c.isspace()]
+            segs, top, cap_h = self._glyph_segments(processed)
+            # 名字后的标记: 末尾贴着字顶的矮字形 ('-' 在字中部)
+            mark = None
+            if segs and segs[-1][3] - segs[-1][2] <= 0.6 * cap_h and segs[-1][2] <= top + 1:
+                mark = segs.pop()[:2]
+            segs = [s[:2] for s in segs]
+            while segs and len(segs) < len(chars):
+                i = max(range(len(segs)), key=lambda j: segs[j][1] - segs[j][0])
+                x0, x1 = segs[i]
+                if x1 - x0 < cap_h * self.GLYPH_SPLIT_RATIO:
+                    break
+                cut = self._split_column(processed, x0, x1, top, cap_h)
+                segs[i:i + 1] = [[x0, cut], [cut, x1]]
+            if len(segs) != len(chars):
+                continue
+            if mark is not None:
+                segs.append(mark)
+                chars = chars + ["*"]
+            for (x0, x1), char in zip(segs, chars):
+                vec = self._glyph_vector(processed, x0, x1, top, cap_h)
+                if vec is not None:
+                    vectors.append(vec)
+                    labels.append(char)
+        if not vectors:
+            return None
+        return {"matrix": np.stack(vectors), "labels": labels}
+
+    def _glyph_match(self, binary, x0, x1, top, cap_h, glyphs):
+        vec = self._glyph_vector(binary, x0, x1, top, cap_h)
+        if vec is None:
+            return "?", 0.0
+        sims = glyphs["matrix"] @ vec
+        i = int(np.argmax(sims))
+        return glyphs["labels"][i], float(sims[i])
+
+    def _read_glyphs(self, binary, glyphs):
+        """把位置栏读成若干词，每词为 [(字符, 分数)]；低于 GLYPH_MIN_SCORE 的字形记为 '?'"""
+        segs, top, cap_h = self._glyph_segments(binary)
+        tokens = [[]]
+        prev_x1 = None
+        for x0, x1, _, _ in segs:
+            if prev_x1 is not None and x0 - prev_x1 > cap_h * self.GLYPH_SPACE_RATIO:
+                tokens.append([])
+            prev_x1 = x1
+            read = [self._glyph_match(binary, x0, x1, top, cap_h, glyphs)]
+            if x1 - x0 > cap_h * self.GLYPH_SPLIT_RATIO:
+                cut = self._split_column(binary, x0, x1, top, cap_h)
+                pair = [self._glyph_match(binary, x0, cut, top, cap_h, glyphs),
+                        self._glyph_match(binary, cut, x1, top, cap_h, glyphs)]
+                if min(pair[0][1], pair[1][1]) > read[0][1]:
+                    read = pair
+            for char, score in read:
+                if char == "*":
+                    tokens.append([])
+                else:
+                    tokens[-1].append((char if score >= self.GLYPH_MIN_SCORE else "?", score))
+        return [t for t in tokens if t]
+
+    def _snap_system_name(self, text):
+        """
+        名单内的名字原样返回；否则只补全低分字形 '?' (至多 LOCATION_MAX_EDITS 个)，其余字符必须与名单一致，
+        且只有唯一一个等长名字符合时才返回它；高分字符不同 (名单外的星系) 返回 None
+        """
+        if not text:
+            return None
+        if text in self.system_names:
+            return text
+        if not 0 < text.count("?") <= self.LOCATION_MAX_EDITS:
+            return None
+        found = [cand for cand in self.system_names_by_len.get(len(text), ())
+                 if all(a == "?" or a == b for a, b in zip(text, cand))]
+        return found[0] if len(found) == 1 else None
+
+    def _read_location_name(self, screen_img, glyphs, threshold, key):
+        """
+        字形识别位置栏: 依次尝试每个词 (及整行)，返回第一个能校正到名单、且平均字形分数 >= threshold 的 (名字, 分数)
+        字形库未覆盖的字符 (素材名字里没出现过) 分数低、记为 '?'，会拉低平均分并占用 LOCATION_MAX_EDITS；
+        名单外的星系 (高分字符与名单不符) 读不出名字；
+        达不到时返回 (None, 最高平均分)，由调用方回退整图匹配
+        """
+        self._check_geometry(key, screen_img.shape)
+        t0 = time.perf_counter()
+        screen_gray = self.frame_gray(screen_img, key)
+        screen_processed = self.preprocess_location(
+            screen_gray, dst=self._buffer(key, "processed", screen_gray.shape))
+        self.metrics.observe("preprocess", (time.perf_counter() - t0) * 1000.0)
+
+        tokens = self._read_glyphs(screen_processed, glyphs)
+        if len(tokens) > 1:
+            line = list(tokens[0])
+            for token in tokens[1:]:
+                line += [(" ", 1.0)] + token
+            tokens.append(line)
+        best_score = 0.0
+        for token in tokens:
+            score = float(np.mean([s for c, s in token if c != " "]))
+            name = self._snap_system_name("".join(c for c, _ in token))
+            if name is not None and score >= threshold:
+                return name, score
+            best_score = max(best_score, score)
+        return None, best_score
+
+    def _match_response(self, screen_processed, tmpl_processed, mask, tmpl_name="?", dst=None):
+        """dst: 预分配的 float32 得分图 (尺寸一致时 OpenCV 直接写入，不再分配)"""
+        t0 = time.perf_counter()
+        res_rows = screen_processed.shape[0] - tmpl_processed.shape[0] + 1
+        if self.TILE_PARALLEL and self.TILE_WORKERS > 1 and res_rows >= 2 * self.TILE_ROWS:
+            res = self._tiled_response(screen_processed, tmpl_processed, mask, dst)
+        elif mask is not None:
+            res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=dst, mask=mask)
+        else:
+            res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=dst)
+        dt = time.perf_counter() - t0
+        self._match_time += dt
+        if self.template_timing is not None:
+            tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+            region = self.metrics.current_labels()[1]
+            label = f"{region}:{tmpl_name} ({tmpl_w}x{tmpl_h})"
+            entry = self.template_timing.setdefault(label, [0, 0.0])
+            entry[0] += 1
+            entry[1] += dt
+        return res
+
+    def _tiled_response(self, screen_processed, tmpl_processed, mask, dst=None):
+        """按得分图行分块在线程池上匹配；每块输入多取 模板高度-1 行，块间得分行不重叠"""
+        tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+        res_h = screen_processed.shape[0] - tmpl_h + 1
+        res_w = screen_processed.shape[1] - tmpl_w + 1
+        res = dst if dst is not None else np.empty((res_h, res_w), dtype=np.float32)
+        if self.tile_executor is None:
+            self.tile_executor = ThreadPoolExecutor(max_workers=self.TILE_WORKERS, thread_name_prefix="vision-tile")
+
+        def run(y0, y1):
+            # 整行切片是连续内存，OpenCV 可直接写入
+            out = res[y0:y1]
+            tile = screen_processed[y0:y1 + tmpl_h - 1]
+            if mask is not None:
+                got = cv2.matchTemplate(tile, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=out, mask=mask)
+            else:
+                got = cv2.matchTemplate(tile, tmpl_processed, cv2.TM_CCOEFF_NORMED, result=out)
+            if not np.shares_memory(got, out):
+                out[...] = got
+
+        # 块数按 TILE_ROWS 取整后均分，避免最后剩下很薄的一块
+        n = max(1, int(round(res_h / float(self.TILE_ROWS))))
+        bounds = np.linspace(0, res_h, n + 1).astype(int)
+        futures = [self.tile_executor.submit(run, bounds[k], bounds[k + 1]) for k in range(n)]
+        for f in futures:
+            f.result()
+        return res
+
+    def _candidate_boxes(self, seeds, cell):
+        """
+        seeds: 粗网格上的布尔候选图，1 格对应得分图中 cell x cell 像素
+        返回得分图坐标下的候选窗口 [(x, y, w, h), ...]，相邻候选合并为一个窗口
+        """
+        n, _, stats, _ = cv2.connectedComponentsWithStats(seeds.astype(np.uint8), connectivity=8)
+        pad = cell + 1
+        return [(x * cell - pad, y * cell - pad, w * cell + 2 * pad, h * cell + 2 * pad)
+                for x, y, w, h, _ in stats[1:]]
+
+    def _pooled_boxes(self, candidates, cell=4):
+        """全分辨率布尔候选图 -> 候选窗口；先按 cell 做最大池化，避免在大图上做连通域分析"""
+        h, w = candidates.shape[:2]
+        ph, pw = -(-h // cell), -(-w // cell)
+        padded = np.zeros((ph * cell, pw * cell), dtype=bool)
+        padded[:h, :w] = candidates
+        pooled = padded.reshape(ph, cell, pw, cell).any(axis=(1, 3))
+        return self._candidate_boxes(pooled, cell)
+
+    def _windowed_response(self, screen_processed, tmpl_processed, mask, boxes, tmpl_name="?", dst=None):
+        """只在候选窗口 boxes (得分图坐标) 内计算得分，其余位置填 -1"""
+        tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+        res_h = screen_processed.shape[0] - tmpl_h + 1
+        res_w = screen_processed.shape[1] - tmpl_w + 1
+        res = dst if dst is not None else np.empty((res_h, res_w), dtype=np.float32)
+        res.fill(-1.0)
+        for x, y, w, h in boxes:
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(res_w, x + w), min(res_h, y + h)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            sub = screen_processed[y0:y1 + tmpl_h - 1, x0:x1 + tmpl_w - 1]
+            res[y0:y1, x0:x1] = self._match_response(sub, tmpl_processed, mask, tmpl_name)
+        return res
+
+    def _half_template(self, template_list, idx):
+        half = template_list.half[idx]
+        if half is None:
+            tmpl, mask = template_list[idx][0], template_list[idx][1]
+            h, w = tmpl.shape[:2]
+            if min(h, w) < self.PYRAMID_MIN_TEMPLATE:
+                half = False
+            else:
+                size = (w // 2, h // 2)
+                half_tmpl = cv2.resize(tmpl, size, interpolation=cv2.INTER_AREA)
+                half_mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST) if mask is not None else None
+                half = (half_tmpl, half_mask) if half_tmpl.std() > 0 else False
+            template_list.half[idx] = half
+        return half
+
+    def _pyramid_context(self, screen_processed, template_list, threshold, key=None):
+        """大区域返回金字塔上下文 (半分辨率画面 + 放宽阈值)，否则 None"""
+        if not self.PYRAMID_MATCHING or not hasattr(template_list, "half"):
+            return None
+        h, w = screen_processed.shape[:2]
+        if h * w < self.PYRAMID_MIN_AREA:
+            return None
+        half_screen = cv2.resize(screen_processed, (w // 2, h // 2),
+                                 dst=self._buffer(key, "half", (h // 2, w // 2)), interpolation=cv2.INTER_AREA)
+        self.metrics.inc("pyramid_frames")
+        return {"half": half_screen, "threshold": threshold - self.PYRAMID_RELAX}
+
+    def _sea_parts(self, shape):
+        """模板划分: SEA_GRID x SEA_GRID 等大分块 + 除不尽时的底部/右侧余条，[(y0, y1, x0, x1), ...]"""
+        th, tw = shape[:2]
+        gy, gx = min(self.SEA_GRID, th), min(self.SEA_GRID, tw)
+        ch, cw = th // gy, tw // gx
+        parts = [(i * ch, (i + 1) * ch, j * cw, (j + 1) * cw) for i in range(gy) for j in range(gx)]
+        if th > gy * ch:
+            parts.append((gy * ch, th, 0, tw))
+        if tw > gx * cw:
+            parts.append((0, gy * ch, gx * cw, tw))
+        return parts
+
+    def _sea_template(self, template_list, idx):
+        """(分块能量列表, 总能量, 划分网格)；SEA_GRID 改变后重新计算"""
+        sea = template_list.sea[idx]
+        if sea is None or (sea and sea[2] != self.SEA_GRID):
+            tmpl, mask = template_list[idx][0], template_list[idx][1]
+            sea = False
+            if mask is None:
+                t = tmpl.astype(np.float64)
+                t -= t.mean()
+                norm = float(np.sqrt((t * t).sum()))
+                if norm > 0:
+                    weights = [float(np.sqrt((t[y0:y1, x0:x1] ** 2).sum())) for y0, y1, x0, x1 in self._sea_parts(t.shape)]
+                    sea = (weights, norm, self.SEA_GRID)
+            template_list.sea[idx] = sea
+        return sea
+
+    def _sea_context(self, screen_processed, template_list, threshold, key=None):
+        """本帧的 SEA 上下文 (各模板尺寸的分块能量图按需计算、同尺寸模板共用)，不适用时 None"""
+        if not self.SEA_PREFILTER or getattr(template_list, "type_key", None) not in self.SEA_TYPES:
+            return None
+        f = screen_processed.astype(np.float32)
+        return {"f": f, "sq": cv2.multiply(f, f), "boxes": {}, "shapes": {}, "threshold": threshold}
+
+    def _sea_box(self, sea, size):
+        """(h, w) 窗口的和/平方和图: 位置 (y, x) 为以其为左上角的窗口之和"""
+        boxes = sea["boxes"].get(size)
+        if boxes is None:
+            h, w = size
+            boxes = sea["boxes"][size] = tuple(
+                cv2.boxFilter(src, -1, (w, h), anchor=(0, 0), normalize=False, borderType=cv2.BORDER_CONSTANT)
+                for src in (sea["f"], sea["sq"]))
+        return boxes
+
+    def _sea_shape(self, sea, shape):
+        """模板尺寸 shape 下每个位置的窗口去均值能量 nw 与各分块 (以窗口均值去均值) 能量图"""
+        entry = sea["shapes"].get(shape)
+        if entry is not None:
+            return entry
+        th, tw = shape
+        rh, rw = sea["f"].shape[0] - th + 1, sea["f"].shape[1] - tw + 1
+        n = float(th * tw)
+        s_win, q_win = (b[:rh, :rw] for b in self._sea_box(sea, (th, tw)))
+        mu = s_win / n
+        nw = np.sqrt(np.maximum(q_win - mu * s_win, 0.0))
+        tmp = np.empty((rh, rw), dtype=np.float32)
+        energies = []
+        for y0, y1, x0, x1 in self._sea_parts(shape):
+            s_box, q_box = self._sea_box(sea, (y1 - y0, x1 - x0))
+            s_k, q_k = s_box[y0:y0 + rh, x0:x0 + rw], q_box[y0:y0 + rh, x0:x0 + rw]
+            # ||W_k - mu||^2 = Q_k - mu * (2 S_k - n_k mu)
+            e_k = np.empty((rh, rw), dtype=np.float32)
+            np.multiply(mu, -float((y1 - y0) * (x1 - x0)), out=tmp)
+            tmp += s_k
+            tmp += s_k
+            tmp *= mu
+            np.subtract(q_k, tmp, out=e_k)
+            np.maximum(e_k, 0.0, out=e_k)
+            np.sqrt(e_k, out=e_k)
+            energies.append(e_k)
+        entry = sea["shapes"][shape] = (nw, energies)
+        return entry
+
+    def _sea_candidates(self, sea, template_list, idx):
+        """上界达到阈值的位置 (布尔图)；模板不适用时 None"""
+        stats = self._sea_template(template_list, idx)
+        if not stats:
+            return None
+        weights, norm, _ = stats
+        nw, energies = self._sea_shape(sea, template_list[idx][0].shape[:2])
+        # 上界 = sum_k ||W_k|| ||T_k|| / (||W|| ||T||)；常数窗口 (nw = 0) 的得分为 0，一并排除
+        bound = np.zeros(nw.shape, dtype=np.float32)
+        for w, e_k in zip(weights, energies):
+            if w > 0:
+                cv2.scaleAdd(e_k, w, bound, dst=bound)
+        limit = nw * ((sea["threshold"] - self.SEA_MARGIN) * norm)
+        return (bound >= limit) & (nw > 0.5)
+
+    def _full_response(self, screen_processed, template_list, idx, pyramid, key=None, sea=None):
+        """整幅得分图；有金字塔上下文且模板够大时，或 SEA 上界排除的位置，为 -1"""
+        tmpl, mask, name = template_list[idx][0], template_list[idx][1], template_list[idx][-1]
+        dst = self._res_buffer(key, "res", screen_processed.shape, tmpl.shape)
+        half = self._half_template(template_list, idx) if pyramid is not None else False
+        if not half and sea is not None:
+            candidates = self._sea_candidates(sea, template_list, idx)
+            if candidates is not None:
+                kept = int(np.count_nonzero(candidates))
+                region = {"region": template_list.type_key}
+                self.metrics.inc("sea_positions", region, candidates.size)
+                self.metrics.inc("sea_pruned", region, candidates.size - kept)
+                if kept <= self.SEA_MAX_KEEP * candidates.size:
+                    boxes = self._pooled_boxes(candidates) if kept else []
+                    return self._windowed_response(screen_processed, tmpl, mask, boxes, name, dst)
+        if not half:
+            return self._match_response(screen_processed, tmpl, mask, name, dst)
+
+        half_tmpl, half_mask = half
+        hs = pyramid["half"]
+        if hs.shape[0] < half_tmpl.shape[0] or hs.shape[1] < half_tmpl.shape[1]:
+            return self._match_response(screen_processed, tmpl, mask, name, dst)
+        coarse = self._match_response(hs, half_tmpl, half_mask, name + "@half",
+                                      self._res_buffer(key, "coarse", hs.shape, half_tmpl.shape))
+        np.nan_to_num(coarse, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+
+        # 半分辨率候选 -> 全分辨率得分图窗口
+        boxes = self._candidate_boxes(coarse >= pyramid["threshold"], 2)
+        return self._windowed_response(screen_processed, tmpl, mask, boxes, name, dst)
+
+    def _collect_hits(self, res, screen_img, tmpl_w, tmpl_h, threshold, check_safe_color, mask_map, hits=None):
+        """
+        从得分图中逐个取峰值计数 (会修改 res)，返回 (新增数量, 最高分)
+        hits 不为 None 时追加计入数量的命中框 (x, y, w, h)
+        """
+        count = 0
+        max_score = 0.0
+        while True:
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+            if np.isinf(max_val) or np.isnan(max_val): max_val = 0.0
+            
+            if max_val >= 0.2:
+                top_left = max_loc
+                bottom_right = (top_left[0] + tmpl_w, top_left[1] + tmpl_h)
+                
+                is_safe = False
+                if check_safe_color:
+                    t0 = time.perf_counter()
+                    crop_img = screen_img[top_left[1]:bottom_right[1], top_left[0]:bottom_right[0]]
+                    if self._is_safe_color(crop_img):
+                        is_safe = True
+                    self._safe_time += time.perf_counter() - t0
+                
+                if is_safe:
+                    cv2.rectangle(res, top_left, bottom_right, -1.0, -1)
+                    continue
+                else:
+                    if max_val > max_score:
+                        max_score = max_val
+                    
+                    if max_val >= threshold:
+                        center_x = int(top_left[0] + tmpl_w/2)
+                        center_y = int(top_left[1] + tmpl_h/2)
+                        if mask_map[center_y, center_x] == 0:
+                            count += 1
+                            cv2.rectangle(mask_map, top_left, bottom_right, 255, -1)
+                            if hits is not None:
+                                hits.append((top_left[0], top_left[1], tmpl_w, tmpl_h))
+                        cv2.rectangle(res, top_left, bottom_right, -1.0, -1)
+                    else:
+                        break
+            else:
+                break 
+        return count, max_score
+
+    def reset_region_state(self):
+        """清空按 (客户端, 区域) 学习的状态，开始监控或区域变化时调用"""
+        self.roi_state = {}
+        self.track_state = {}
+        self.prep_buffers = {}
+        self.buffer_geometry = {}
+        self.buffer_bytes = 0
+        self.metrics.set_gauge("scratch_buffer_bytes", 0)
+
+    def _frame_thumb(self, gray):
+        h, w = gray.shape[:2]
+        return cv2.resize(gray, (max(1, w // 4), max(1, h // 4)), interpolation=cv2.INTER_AREA)
+
+    def _track_verify(self, key, template_list, screen_img, gray, threshold, check_safe_color):
+        """
+        画面变化检测 + 命中复核；返回 (count, score) 表示本周期无需整区域搜索，None 表示需要
+        同时返回本帧缩略图供整区域搜索后更新状态
+        """
+        thumb = self._frame_thumb(gray)
+        st = self.track_state.get(key)
+        if st is None or st["thumb"].shape != thumb.shape:
+            return None, thumb
+        if st["since_full"] >= self.TRACK_FULL_SCAN_EVERY:
+            return None, thumb
+        diff = cv2.absdiff(thumb, st["thumb"])
+        if cv2.minMaxLoc(diff)[1] > self.TRACK_CHANGE_DELTA:
+            self.metrics.inc("track_frame_changed")
+            return None, thumb
+
+        best = 0.0
+        img_h, img_w = screen_img.shape[:2]
+        m = self.TRACK_MARGIN
+        for x, y, w, h, idx in st["tracks"]:
+            if idx >= len(template_list):
+                return None, thumb
+            tmpl, mask = template_list[idx][0], template_list[idx][1]
+            x0, y0 = max(0, x - m), max(0, y - m)
+            x1, y1 = min(img_w, x + w + m), min(img_h, y + h + m)
+            window = screen_img[y0:y1, x0:x1]
+            if window.shape[0] < h or window.shape[1] < w:
+                return None, thumb
+            processed = self.preprocess_image(gray[y0:y1, x0:x1])
+            res = self._match_response(processed, tmpl, mask, template_list[idx][-1])
+            _, max_val, _, loc = cv2.minMaxLoc(res)
+            if np.isnan(max_val) or max_val < threshold:
+                return None, thumb
+            if check_safe_color:
+                crop = window[loc[1]:loc[1] + h, loc[0]:loc[0] + w]
+                if self._is_safe_color(crop):
+                    return None, thumb
+            best = max(best, max_val)
+
+        st["since_full"] += 1
+        self.metrics.inc("track_verified")
+        if not st["tracks"]:
+            return st["last"], thumb
+        return (len(st["tracks"]), max(best, st["last"][1])), thumb
+
+    def _track_update(self, key, thumb, hits, result):
+        self.track_state[key] = {"thumb": thumb, "tracks": hits, "since_full": 0, "last": result}
+
+    def _roi_window(self, key, template_list, gray):
+        """返回本次应扫描的列范围 (x0, x1)；None 表示全宽扫描"""
+        if not self.ROI_NARROWING or key is None:
+            return None
+        if getattr(template_list, "type_key", None) not in self.ROI_TYPES:
+            return None
+        shape = gray.shape[:2]
+        thumb = self._frame_thumb(gray)
+        st = self.roi_state.get(key)
+        if st is None or st["shape"] != shape:
+            self.roi_state[key] = {"shape": shape, "strip": None, "since_full": 0, "thumb": thumb}
+            return None
+        prev, st["thumb"] = st["thumb"], thumb
+        if st["strip"] is None or st["since_full"] >= self.ROI_FULL_SCAN_EVERY:
+            return None
+        max_w = max(t[0].shape[1] for t in template_list)
+        x0 = max(0, st["strip"][0] - self.ROI_MARGIN)
+        x1 = min(shape[1], st["strip"][1] + self.ROI_MARGIN)
+        if x1 - x0 < max_w:
+            return None
+        # 缩略图上完全落在扫描列以外的部分
+        diff = cv2.absdiff(thumb, prev)
+        outside = [diff[:, :x0 // 4], diff[:, -(-x1 // 4):]]
+        if any(part.size and cv2.minMaxLoc(part)[1] > self.ROI_CHANGE_DELTA for part in outside):
+            self.metrics.inc("roi_frame_changed")
+            return None
+        self.metrics.inc("roi_narrowed")
+        return x0, x1
+
+    def _roi_learn(self, key, roi, hits):
+        """用确认命中更新图标列；全宽扫描有命中时重新学习，收窄扫描的命中并入现有列"""
+        st = self.roi_state.get(key)
+        if st is None:
+            return
+        x_off = roi[0] if roi else 0
+        if roi is None:
+            st["since_full"] = 0
+        else:
+            st["since_full"] += 1
+        if not hits:
+            return
+        left = min(h[0] for h in hits) + x_off
+        right = max(h[0] + h[2] for h in hits) + x_off
+        if roi is None or st["strip"] is None:
+            st["strip"] = (left, right)
+        else:
+            st["strip"] = (min(st["strip"][0], left), max(st["strip"][1], right))
+
+    def count_cache_key(self, screen_img, template_list, threshold, check_safe_color):
+        """结果缓存键；模板库重新加载时缓存整体清空，因此用模板库对象标识区分"""
+        if not self.RESULT_CACHE or screen_img is None or not template_list:
+            return None
+        return ("count", frame_digest(screen_img), id(template_list), float(threshold), bool(check_safe_color))
+
+    def count_matches(self, screen_img, template_list, threshold, check_safe_color=False, key=None):
+        """key: (客户端, 区域)，用于按区域保存的学习状态 (图标列 ROI 等)"""
         if screen_img is None or not template_list:
             return 0, 0.0
+        cache_key = self.count_cache_key(screen_img, template_list, threshold, check_safe_color)
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key, "count")
+            if cached is not None:
+                return cached
+        if self._row_engine(template_list):
+            result = self._count_rows(screen_img, template_list, threshold, check_safe_color, key)
+        else:
+            result = self._count_matches(screen_img, template_list, threshold, check_safe_color, key)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+        return result
+
+    def _count_matches(self, screen_img, template_list, threshold, check_safe_color, key):
+        self._check_geometry(key, screen_img.shape)
+
+        # 整帧灰度只算一次 (写入复用缓冲)，变化检测 / 命中复核 / 预处理共用
+        t0 = time.perf_counter()
+        screen_gray = self.frame_gray(screen_img, key)
+        prep_ms = (time.perf_counter() - t0) * 1000.0
+
+        tracking = (self.TRACK_HITS and key is not None
+                    and getattr(template_list, "type_key", None) in self.TRACK_TYPES)
+        if tracking:
+            tracked, thumb = self._track_verify(key, template_list, screen_img, screen_gray,
+                                                threshold, check_safe_color)
+            if tracked is not None:
+                return tracked
+
+        roi = self._roi_window(key, template_list, screen_gray)
+        if roi is not None:
+            screen_img = screen_img[:, roi[0]:roi[1]]
+            screen_gray = screen_gray[:, roi[0]:roi[1]]
+        hits = [] if key is not None else None
 
-        screen_gray = cv2.cvtColor(screen_img, cv2.COLOR_BGR2GRAY)
-        screen_processed = self.preprocess_image(screen_gray)
+        t0 = time.perf_counter()
+        screen_processed = self.preprocess_image(
+            screen_gray, dst=self._buffer(key, "processed", screen_gray.shape))
+        self.metrics.observe("preprocess", prep_ms + (time.perf_counter() - t0) * 1000.0)
         
         total_count = 0
         global_max_score = 0.0
+        self._match_time = 0.0
+        self._safe_time = 0.0
         
-        mask_map = np.zeros(screen_processed.shape, dtype=np.uint8)
+        mask_map = self._buffer(key, "mask_map", screen_processed.shape)
+        mask_map.fill(0)
 
-        for item in template_list:
-            if len(item) == 3: tmpl_processed, mask, _ = item
-            else: tmpl_processed, mask = item
+        # 聚类: 代表模板的原始得分图 (成员据此判断是否需要检查)
+        reps = getattr(template_list, "rep", None)
+        rep_sims = getattr(template_list, "rep_sim", None)
+        rep_responses = {}
+        pyramid = self._pyramid_context(screen_processed, template_list, threshold, key)
+        sea = self._sea_context(screen_processed, template_list, threshold, key)
+        if pyramid is not None:
+            # 金字塔得分图只在候选窗口内有效，不能作为簇成员的下界，聚类门控关闭
+            reps = None
+        has_members = set(reps[i] for i in range(len(reps)) if reps[i] != i) if reps else set()
+
+        for idx, item in enumerate(template_list):
+            if len(item) == 3: tmpl_processed, mask, tmpl_name = item
+            else: 
+                tmpl_processed, mask = item
+                tmpl_name = "?"
             
             tmpl_h, tmpl_w = tmpl_processed.shape[:2]
             if screen_processed.shape[0] < tmpl_h or screen_processed.shape[1] < tmpl_w:
                 continue
 
             try:
-                if mask is not None:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED, mask=mask)
+                if reps and reps[idx] != idx:
+                    # 簇成员: 只在代表得分达到下界的位置检查
+                    rep_idx = reps[idx]
+                    rep_res = rep_responses.get(rep_idx)
+                    if rep_res is None:
+                        rep_tmpl, rep_mask, rep_name = template_list[rep_idx][:3]
+                        rep_res = self._match_response(
+                            screen_processed, rep_tmpl, rep_mask, rep_name,
+                            self._res_buffer(key, ("rep", rep_idx), screen_processed.shape, rep_tmpl.shape))
+                        rep_responses[rep_idx] = rep_res
+                    gate = self._cluster_gate(rep_sims[idx], threshold)
+                    if gate is None:
+                        res = self._full_response(screen_processed, template_list, idx, pyramid, key, sea)
+                    else:
+                        candidates = rep_res >= gate
+                        if not candidates.any():
+                            self.metrics.inc("cluster_skipped")
+                            continue
+                        self.metrics.inc("cluster_checked")
+                        boxes = self._pooled_boxes(candidates)
+                        res = self._windowed_response(
+                            screen_processed, tmpl_processed, mask, boxes, tmpl_name,
+                            self._res_buffer(key, "res", screen_processed.shape, tmpl_processed.shape))
+                elif idx in has_members:
+                    # 代表的原始得分图要留给成员做门控，计数用的是其副本
+                    rep_res = rep_responses.get(idx)
+                    if rep_res is None:
+                        rep_res = self._match_response(
+                            screen_processed, tmpl_processed, mask, tmpl_name,
+                            self._res_buffer(key, ("rep", idx), screen_processed.shape, tmpl_processed.shape))
+                        rep_responses[idx] = rep_res
+                    res = self._res_buffer(key, "res", screen_processed.shape, tmpl_processed.shape)
+                    np.copyto(res, rep_res)
+                elif hasattr(template_list, "half"):
+                    res = self._full_response(screen_processed, template_list, idx, pyramid, key, sea)
                 else:
-                    res = cv2.matchTemplate(screen_processed, tmpl_processed, cv2.TM_CCOEFF_NORMED)
+                    res = self._match_response(
+                        screen_processed, tmpl_processed, mask, tmpl_name,
+                        self._res_buffer(key, "res", screen_processed.shape, tmpl_processed.shape))
                 
-                while True:
-                    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-                    if np.isinf(max_val) or np.isnan(max_val): max_val = 0.0
-                    
-                    if max_val >= 0.2:
-                        top_left = max_loc
-                        bottom_right = (top_left[0] + tmpl_w, top_left[1] + tmpl_h)
-                        
-                        is_safe = False
-                        if check_safe_color:
-                            crop_img = screen_img[top_left[1]:bottom_right[1], top_left[0]:bottom_right[0]]
-                            if self._is_safe_color(crop_img):
-                                is_safe = True
-                        
-                        if is_safe:
-                            cv2.rectangle(res, top_left, bottom_right, -1.0, -1)
-                            continue
-                        else:
-                            if max_val > global_max_score:
-                                global_max_score = max_val
-                            
-                            if max_val >= threshold:
-                                center_x = int(top_left[0] + tmpl_w/2)
-                                center_y = int(top_left[1] + tmpl_h/2)
-                                if mask_map[center_y, center_x] == 0:
-                                    total_count += 1
-                                    cv2.rectangle(mask_map, top_left, bottom_right, 255, -1)
-                                cv2.rectangle(res, top_left, bottom_right, -1.0, -1)
-                            else:
-                                break
-                    else:
-                        break 
+                n_hits = len(hits) if hits is not None else 0
+                cnt, score = self._collect_hits(res, screen_img, tmpl_w, tmpl_h, threshold,
+                                                check_safe_color, mask_map, hits)
+                if hits is not None:
+                    for k in range(n_hits, len(hits)):
+                        hits[k] = hits[k] + (idx,)
+                total_count += cnt
+                if score > global_max_score:
+                    global_max_score = score
             except Exception:
                 continue
 
+        self.metrics.observe("match", self._match_time * 1000.0)
+        if check_safe_color:
+            self.metrics.observe("safe_color", self._safe_time * 1000.0)
+        if key is not None:
+            self._roi_learn(key, roi, hits)
+        if tracking:
+            x_off = roi[0] if roi else 0
+            tracks = [(x + x_off, y, w, h, idx) for x, y, w, h, idx in hits]
+            self._track_update(key, thumb, tracks, (total_count, global_max_score))
         return total_count, global_max_score
 
+    def count_matches_batch(self, frames, template_list, threshold, check_safe_color=False):
+        """
+        frames: [(key, screen_img), ...] 同一模板库 (同类区域、同缩放) 的多个画面，返回 [(count, score), ...]
+        结果缓存 / 命中跟踪仍按帧处理；其余帧竖向拼成一张图，每个模板只匹配一次，
+        得分图按帧切回各自的有效区域 (窗口完全落在该帧内的位置) 再分别计数，命中不会跨帧
+        拼图路径不做 ROI 收窄 / 金字塔 / 聚类门控
+        """
+        results = [(0, 0.0)] * len(frames)
+        if not template_list:
+            return results
+        live = [(i, key, img) for i, (key, img) in enumerate(frames) if img is not None]
+        if len(live) < self.MOSAIC_MIN_FRAMES or self._row_engine(template_list):
+            for i, key, img in live:
+                results[i] = self.count_matches(img, template_list, threshold, check_safe_color, key)
+            return results
+
+        tracking = self.TRACK_HITS and getattr(template_list, "type_key", None) in self.TRACK_TYPES
+        pending = []
+        for i, key, img in live:
+            cache_key = self.count_cache_key(img, template_list, threshold, check_safe_color)
+            if cache_key is not None:
+                cached = self.result_cache.get(cache_key, "count")
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            self._check_geometry(key, img.shape)
+            gray = self.frame_gray(img, key)
+            thumb = None
+            if tracking and key is not None:
+                tracked, thumb = self._track_verify(key, template_list, img, gray, threshold, check_safe_color)
+                if tracked is not None:
+                    results[i] = tracked
+                    continue
+            pending.append({"i": i, "key": key, "img": img, "gray": gray,
+                            "thumb": thumb, "cache_key": cache_key, "count": 0, "score": 0.0, "hits": []})
+        if not pending:
+            return results
+
+        # 拼图: 各帧左上对齐竖向排列，右侧不足部分补 0 (补齐区域不属于任何帧的有效得分区)
+        type_key = getattr(template_list, "type_key", "")
+        mosaic_key = ("mosaic", type_key)
+        height = sum(f["img"].shape[0] for f in pending)
+        width = max(f["img"].shape[1] for f in pending)
+        self._check_geometry(mosaic_key, (height, width, len(pending)))
+        t0 = time.perf_counter()
+        mosaic = self._buffer(mosaic_key, "gray", (height, width))
+        top = 0
+        for f in pending:
+            h, w = f["img"].shape[:2]
+            mosaic[top:top + h, :w] = f["gray"]
+            mosaic[top:top + h, w:] = 0
+            f["top"] = top
+            f["mask_map"] = self._buffer(f["key"], "mask_map", (h, w))
+            f["mask_map"].fill(0)
+            top += h
+        mosaic = self.preprocess_image(mosaic, dst=self._buffer(mosaic_key, "processed", (height, width)))
+        self.metrics.observe("preprocess", (time.perf_counter() - t0) * 1000.0, "", type_key)
+
+        self._match_time = 0.0
+        self._safe_time = 0.0
+        for idx, item in enumerate(template_list):
+            tmpl_processed, mask, tmpl_name = item[0], item[1], item[-1]
+            tmpl_h, tmpl_w = tmpl_processed.shape[:2]
+            targets = [f for f in pending if f["img"].shape[0] >= tmpl_h and f["img"].shape[1] >= tmpl_w]
+            if not targets:
+                continue
+            if height < tmpl_h or width < tmpl_w:
+                continue
+            try:
+                res = self._match_response(mosaic, tmpl_processed, mask, tmpl_name,
+                                           self._res_buffer(mosaic_key, "res", mosaic.shape, tmpl_processed.shape))
+                for f in targets:
+                    h, w = f["img"].shape[:2]
+                    sub = res[f["top"]:f["top"] + h - tmpl_h + 1, :w - tmpl_w + 1]
+                    n_hits = len(f["hits"])
+                    cnt, score = self._collect_hits(sub, f["img"], tmpl_w, tmpl_h, threshold,
+                                                    check_safe_color, f["mask_map"], f["hits"])
+                    for k in range(n_hits, len(f["hits"])):
+                        f["hits"][k] = f["hits"][k] + (idx,)
+                    f["count"] += cnt
+                    if score > f["score"]:
+                        f["score"] = score
+            except Exception:
+                continue
+
+        self.metrics.observe("match", self._match_time * 1000.0, "", type_key)
+        if check_safe_color:
+            self.metrics.observe("safe_color", self._safe_time * 1000.0, "", type_key)
+        self.metrics.inc("mosaic_frames", {"region": type_key}, len(pending))
+        for f in pending:
+            result = (f["count"], f["score"])
+            if f["thumb"] is not None:
+                self._track_update(f["key"], f["thumb"], f["hits"], result)
+            if f["cache_key"] is not None:
+                self.result_cache.put(f["cache_key"], result)
+            results[f["i"]] = result
+        return results
+
+    def _row_engine(self, template_list):
+        return self.DETECTION_ENGINE == "rows" and getattr(template_list, "type_key", None) in self.ROW_TYPES
+
+    def _row_groups(self, template_list):
+        """
+        按 (尺寸, mask) 把模板分组，每组一个归一化矩阵 (K x n)，组内所有模板与同一批小块一次矩阵乘完成相关
+        mask 模板只取 mask 内像素计算相关；结果缓存在模板库上
+        """
+        if template_list.rows is not None:
+            return template_list.rows
+        groups = {}
+        for idx, (tmpl, mask, _) in enumerate(template_list):
+            select = np.flatnonzero(mask.ravel() > 0) if mask is not None else None
+            vec = tmpl.astype(np.float32).ravel()
+            if select is not None:
+                vec = vec[select]
+            vec = vec - vec.mean()
+            norm = float(np.linalg.norm(vec))
+            if norm == 0:
+                continue
+            group_key = (tmpl.shape, select.tobytes() if select is not None else None)
+            group = groups.setdefault(group_key, {"shape": tmpl.shape, "select": select, "vectors": [], "indices": [],
+                                                  "ink_left": 0})
+            group["vectors"].append(vec / norm)
+            group["indices"].append(idx)
+            # 模板左侧暗边的宽度: 画面上图标列的左边界 (首个亮列) 会比图标实际左边界偏右这么多
+            ink_cols = np.flatnonzero((tmpl > self._ink_level(tmpl)).any(axis=0))
+            if len(ink_cols):
+                group["ink_left"] = max(group["ink_left"], int(ink_cols[0]))
+        template_list.rows = []
+        for group in groups.values():
+            group["matrix"] = np.stack(group.pop("vectors"))
+            template_list.rows.append(group)
+        return template_list.rows
+
+    def _ink_level(self, processed):
+        """墨迹阈值: 背景亮度 (隔 4 像素取样的中位数) + ROW_INK_DELTA"""
+        return float(np.median(processed[::4, ::4])) + self.ROW_INK_DELTA
+
+    def _row_layout(self, processed, max_w):
+        """
+        图标列左边界 x 与有内容的行 (布尔数组，按图标列统计)；找不到图标列时 (None, None)
+        空行 (行间隙 / 无图标的行) 上的位置不再参与分类
+        """
+        ink = processed > self._ink_level(processed)
+        cols = np.flatnonzero(np.count_nonzero(ink, axis=0) >= self.ROW_MIN_INK)
+        if not len(cols):
+            return None, None
+        x = int(cols[0])
+        return x, ink[:, x:x + max_w].any(axis=1)
+
+    def _count_rows(self, screen_img, template_list, threshold, check_safe_color, key):
+        """
+        行分类引擎: 只在图标列 (x ± ROW_JITTER) 上、与有内容的行重叠的位置取小块，
+        每组模板一次矩阵乘得到每个小块的最佳模板与归一化相关分数；
+        之后按分数从高到低取峰，与 _collect_hits 相同的友军色排除与 mask_map 中心去重，返回 (count, max_score)
+        """
+        self._check_geometry(key, screen_img.shape)
+        t0 = time.perf_counter()
+        gray = self.frame_gray(screen_img, key)
+        processed = self.preprocess_image(gray, dst=self._buffer(key, "processed", gray.shape))
+        self.metrics.observe("preprocess", (time.perf_counter() - t0) * 1000.0)
+
+        groups = self._row_groups(template_list)
+        if not groups:
+            return 0, 0.0
+        t0 = time.perf_counter()
+        x, row_ink = self._row_layout(processed, max(g["shape"][1] for g in groups))
+        if x is None:
+            return 0, 0.0
+        img_h, img_w = processed.shape[:2]
+        candidates = []
+        for group in groups:
+            th, tw = group["shape"]
+            x0, x1 = max(0, x - group["ink_left"] - self.ROW_JITTER), min(img_w - tw, x + self.ROW_JITTER)
+            if x1 < x0 or img_h < th:
+                continue
+            # 窗口 [y, y + th) 内含有内容行的 y
+            ys = np.flatnonzero(np.convolve(row_ink, np.ones(th, dtype=np.int32), "valid") > 0)
+            if not len(ys):
+                continue
+            win = np.lib.stride_tricks.sliding_window_view(processed[:, x0:x1 + tw], (th, tw))[ys]
+            n_x = win.shape[1]
+            P = win.reshape(-1, th * tw).astype(np.float32)
+            if group["select"] is not None:
+                P = P[:, group["select"]]
+            P -= P.mean(axis=1, keepdims=True)
+            norms = np.linalg.norm(P, axis=1)
+            norms[norms == 0] = np.inf
+            scores = (P @ group["matrix"].T) / norms[:, None]
+            k_best = scores.argmax(axis=1)
+            s_best = scores[np.arange(len(k_best)), k_best]
+            for m in np.flatnonzero(s_best >= 0.2):
+                candidates.append((float(s_best[m]), x0 + int(m % n_x), int(ys[m // n_x]), th, tw))
+        self._match_time = time.perf_counter() - t0
+        self.metrics.observe("match", self._match_time * 1000.0)
+
+        count = 0
+        max_score = 0.0
+        safe_time = 0.0
+        mask_map = self._buffer(key, "mask_map", processed.shape)
+        mask_map.fill(0)
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        for score, cx, cy, th, tw in candidates:
+            # 已计入或已判定为友军的图标，其附近的候选不再处理
+            if mask_map[cy + th // 2, cx + tw // 2]:
+                continue
+            if check_safe_color:
+                t1 = time.perf_counter()
+                is_safe = self._is_safe_color(screen_img[cy:cy + th, cx:cx + tw])
+                safe_time += time.perf_counter() - t1
+                if is_safe:
+                    cv2.rectangle(mask_map, (cx, cy), (cx + tw, cy + th), 128, -1)
+                    continue
+            max_score = max(max_score, score)
+            if score < threshold:
+                break
+            count += 1
+            cv2.rectangle(mask_map, (cx, cy), (cx + tw, cy + th), 255, -1)
+        if check_safe_color:
+            self.metrics.observe("safe_color", safe_time * 1000.0)
+        return count, max_score
+
     def match_templates(self, screen_img, template_list, threshold, return_max_val=False, check_safe_color=False):
         count, score = self.count_matches(screen_img, template_list, threshold, check_safe_color)
         if return_max_val:
@@ -0,0 +1,237 @@
+import time
+import zlib
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# 进入进程池的模板类型 (location 每 3 秒一次，留在主进程)
+ATLAS_TYPES = ("local", "overview", "monster", "probe")
+RING_SLOTS = 4
+RING_SLOT_BYTES = 2 * 1024 * 1024
+
+
+def build_atlas(templates):
+    """
+    把所有模板 (processed / mask) 连续打包进一块共享内存
+    返回 (SharedMemory, index)；index 只含偏移/形状/聚类信息，可直接 pickle 给工作进程
+    """
+    layout = []
+    total = 0
+
+    def reserve(arr):
+        nonlocal total
+        if arr is None:
+            return None
+        entry = (total, arr.shape)
+        layout.append((total, arr))
+        total += arr.nbytes
+        return entry
+
+    index = {}
+    for type_key in ATLAS_TYPES:
+        index[type_key] = {}
+        for scale, bank in templates.get(type_key, {}).items():
+            items = []
+            for item in bank:
+                items.append((item[2], reserve(item[0]), reserve(item[1])))
+            index[type_key][scale] = {
+                "items": items,
+                "rep": list(getattr(bank, "rep", range(len(bank)))),
+                "rep_sim": list(getattr(bank, "rep_sim", [1.0] * len(bank))),
+            }
+
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    for offset, arr in layout:
+        np.ndarray(arr.shape, np.uint8, shm.buf, offset)[...] = arr
+    return shm, index
+
+
+def load_atlas(buf, index):
+    """工作进程: 按 index 在共享内存上直接构造 TemplateBank (数组为只读视图，不复制)"""
+    from core.vision import TemplateBank
+
+    def view(entry):
+        if entry is None:
+            return None
+        offset, shape = entry
+        arr = np.ndarray(shape, np.uint8, buf, offset)
+        arr.flags.writeable = False
+        return arr
+
+    templates = {}
+    for type_key, scales in index.items():
+        templates[type_key] = {}
+        for scale, meta in scales.items():
+            bank = TemplateBank([(view(t), view(m), name) for name, t, m in meta["items"]], type_key)
+            bank.rep = meta["rep"]
+            bank.rep_sim = meta["rep_sim"]
+            templates[type_key][scale] = bank
+    return templates
+
+
+def _worker_main(atlas_name, index, tunables, jobs, results):
+    from core.vision import VisionEngine
+
+    atlas = shared_memory.SharedMemory(name=atlas_name)
+    engine = VisionEngine(autoload=False)
+    for k, v in tunables.items():
+        setattr(engine, k, v)
+    engine.templates.update(load_atlas(atlas.buf, index))
+    rings = {}
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        if job[0] == "ring":
+            rings[job[1]] = shared_memory.SharedMemory(name=job[1])
+            continue
+        if job[0] == "tune":
+            for k, v in job[1].items():
+                setattr(engine, k, v)
+            continue
+        _, job_id, ring_name, offset, shape, type_key, scale, threshold, safe_color, key = job
+        t0 = time.perf_counter()
+        error = None
+        try:
+            frame = np.ndarray(shape, np.uint8, rings[ring_name].buf, offset)
+            tmpls = engine.templates[type_key].get(scale, [])
+            cnt, score = engine.count_matches(frame, tmpls, threshold, check_safe_color=safe_color, key=key)
+            del frame
+        except Exception as e:
+            # 不能当作 0 命中返回: 交给主进程 result() 抛出，由调用方回退到本进程匹配
+            cnt, score, error = 0, 0.0, f"{type(e).__name__}: {e}"
+        results.put((job_id, cnt, float(score), (time.perf_counter() - t0) * 1000.0, error))
+
+
+class _Ring:
+    """主进程侧的帧环形缓冲: RING_SLOTS 个定长槽位，帧按原始字节写入，不经 pickle"""
+    def __init__(self, slot_bytes):
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_bytes * RING_SLOTS)
+        self.free = list(range(RING_SLOTS))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+
+class VisionPool:
+    """
+    多进程匹配: 主进程只负责截图/判定/UI，count_matches 在工作进程中执行
+    同一 (客户端, 区域) 的任务按 key 哈希固定路由到同一工作进程，ROI/命中跟踪等状态保持有效
+    """
+    def __init__(self, vision_engine, workers, timeout=5.0):
+        self.vision = vision_engine
+        self.workers = int(workers)
+        self.timeout = timeout
+        self.procs = []
+        self.job_queues = []
+        self.results = None
+        self.rings = []
+        self.retired = []
+        self.atlas = None
+        self.pending = {}
+        self.done = {}
+        self.job_seq = 0
+
+    def start(self):
+        ctx = mp.get_context("spawn")
+        self.atlas, index = build_atlas(self.vision.templates)
+        tunables = {k: v for k, v in vars(self.vision).items() if k.isupper()}
+        self.results = ctx.Queue()
+        for _ in range(self.workers):
+            jobs = ctx.Queue()
+            ring = _Ring(RING_SLOT_BYTES)
+            jobs.put(("ring", ring.name))
+            proc = ctx.Process(target=_worker_main, args=(self.atlas.name, index, tunables, jobs, self.results),
+                               daemon=True)
+            proc.start()
+            self.procs.append(proc)
+            self.job_queues.append(jobs)
+            self.rings.append(ring)
+
+    def stop(self):
+        for jobs in self.job_queues:
+            try:
+                jobs.put(None)
+            except Exception:
+                pass
+        for proc in self.procs:
+            proc.join(timeout=2.0)
+            if proc.is_alive():
+                proc.terminate()
+        for shm in [r.shm for r in self.rings + self.retired] + ([self.atlas] if self.atlas else []):
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+        self.procs, self.job_queues, self.rings, self.retired = [], [], [], []
+        self.atlas = None
+        self.pending, self.done = {}, {}
+
+    def tune(self, values):
+        """把主进程引擎上运行中修改的可调参数 {名称: 值} 转发给所有工作进程 (启动时的参数只复制一次)"""
+        for jobs in self.job_queues:
+            jobs.put(("tune", dict(values)))
+
+    def _route(self, key):
+        return zlib.crc32(repr(key).encode("utf-8")) % self.workers
+
+    def _slot(self, w, nbytes):
+        ring = self.rings[w]
+        if nbytes > ring.slot_bytes:
+            # 帧超过槽位大小: 换一个更大的环，旧环保留到 stop() (仍可能有在途任务引用)
+            size = ring.slot_bytes
+            while size < nbytes:
+                size *= 2
+            self.retired.append(ring)
+            ring = self.rings[w] = _Ring(size)
+            self.job_queues[w].put(("ring", ring.name))
+        while not ring.free:
+            self._drain(block=True)
+        return ring, ring.free.pop()
+
+    def _drain(self, block):
+        try:
+            job_id, cnt, score, ms, error = self.results.get(timeout=self.timeout if block else 0.0)
+        except queue.Empty:
+            if block:
+                raise TimeoutError("vision worker did not respond")
+            return False
+        ring, slot = self.pending.pop(job_id, (None, None))
+        if ring is not None and ring in self.rings:
+            ring.free.append(slot)
+        self.done[job_id] = (cnt, score, ms, error)
+        return True
+
+    def submit(self, img, type_key, scale, threshold, safe_color, key):
+        """返回任务号；img 为 None 时返回 None (结果为 0 命中)"""
+        if img is None:
+            return None
+        img = np.ascontiguousarray(img)
+        w = self._route(key)
+        ring, slot = self._slot(w, img.nbytes)
+        offset = slot * ring.slot_bytes
+        np.ndarray(img.shape, np.uint8, ring.shm.buf, offset)[...] = img
+        self.job_seq += 1
+        job_id = self.job_seq
+        self.pending[job_id] = (ring, slot)
+        self.job_queues[w].put(("match", job_id, ring.name, offset, img.shape, type_key, scale,
+                                threshold, safe_color, key))
+        return job_id
+
+    def result(self, job_id):
+        """阻塞等待任务结果，返回 (count, score, worker_ms)；工作进程匹配出错时抛出 RuntimeError"""
+        if job_id is None:
+            return 0, 0.0, 0.0
+        while job_id not in self.done:
+            if not any(p.is_alive() for p in self.procs):
+                raise RuntimeError("vision workers exited")
+            self._drain(block=True)
+        cnt, score, ms, error = self.done.pop(job_id)
+        if error is not None:
+            raise RuntimeError(f"vision worker error: {error}")
+        return cnt, score, ms
@@ -1,6 +1,7 @@
 import sys
 import os
 import ctypes
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from ui.main_window import MainWindow
 
@@ -11,6 +12,8 @@ def apply_dpi_fix():
         except: pass
 
 if __name__ == "__main__":
+    # 打包为 exe 时视觉工作进程需要
+    multiprocessing.freeze_support()
     apply_dpi_fix()
     app = QApplication(sys.argv)
     win = MainWindow()
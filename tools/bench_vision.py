@@ -0,0 +1,528 @@
+"""
+VisionEngine 基准测试
+
+用法 (在项目根目录执行):
+    python -m tools.bench_vision                      # 跑分并与基线比较
+    python -m tools.bench_vision --save-baseline      # 跑分并保存为新基线
+    python -m tools.bench_vision --corpus recorded/   # 使用录制的画面
+    python -m tools.bench_vision --verify CLUSTER_TEMPLATES
+                                                      # 开关某个优化，核对检测结果一致
+    python -m tools.bench_vision --grab xshm          # 测量截图后端单次截图耗时 (Linux 可在 Xvfb 下运行)
+    python -m tools.bench_vision --alloc              # 每帧临时内存分配 (tracemalloc 峰值)
+    python -m tools.bench_vision --mosaic 5           # 5 个客户端: 逐个匹配 vs 拼图批量匹配 (耗时 + 结果核对)
+    python -m tools.bench_vision --tiles 128,256,512  # 整列高区域: 不分块 vs 各分块行数的并行匹配 (耗时 + 结果核对)
+    python -m tools.bench_vision --sea                # SEA 上界预过滤: 耗时对比与被排除的位置比例
+    python -m tools.bench_vision --engine rows        # 其它检测引擎 vs 模板滑动匹配: 耗时与计数一致率
+    python -m tools.bench_vision --location           # 位置识别: 逐星系整图匹配 vs 字形识别 (耗时 + 名字一致率)
+
+对每个 UI 缩放 (90/100/125) 分别测量 count_matches / match_location_name /
+detect_scale / _is_safe_color 的单次耗时分位数与 FPS。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.vision import VisionEngine
+from tools.corpus import FrameSynth, load_recorded
+
+DEFAULT_BASELINE = os.path.join(ROOT, "bench_baseline.json")
+
+
+def build_corpus(engine, synth, scale, corpus_dir=None, frames_per_kind=12):
+    """返回 {region: [frame, ...]}，优先使用录制语料，缺失部分用合成画面补齐"""
+    corpus = {}
+    for region in ["local", "overview", "monster", "probe", "location"]:
+        frames = load_recorded(corpus_dir, scale, region) if corpus_dir else []
+        if not frames:
+            for n in range(frames_per_kind):
+                if region in ("local", "overview"):
+                    frame, _ = synth.list_frame(region, scale, hostiles=n % 4, blues=n % 3,
+                                                neutrals=6 + n % 5, rows=24)
+                elif region == "location":
+                    frame, _ = synth.location_frame(scale)
+                else:
+                    frame, _ = synth.text_frame(region, scale, present=(n % 2 == 0))
+                frames.append(frame)
+            if region in ("local", "overview"):
+                # 变暗 / 低对比度的图标 (半透明窗口遮挡)，核对预过滤不会漏掉这类真实命中
+                for n, (dim, haze) in enumerate([(0.6, 0.0), (0.4, 0.0), (0.25, 0.0), (1.0, 0.5), (0.6, 0.4)] * 2):
+                    frame, _ = synth.list_frame(region, scale, hostiles=1 + n % 3, blues=n % 2,
+                                                neutrals=6, rows=24, dim=dim, haze=haze)
+                    frames.append(frame)
+                # 图标列右移 (调整了总览列顺序，区域大小不变): 命中落在之前学到的图标列之外
+                for n in range(4):
+                    frame, _ = synth.list_frame(region, scale, hostiles=1 + n % 2, blues=n % 2,
+                                                neutrals=6, rows=24, icon_x=40)
+                    frames.append(frame)
+                # 整屏大小的列表 (宽总览 / 长本地列表)，面积超过 PYRAMID_MIN_AREA，走金字塔粗到细匹配
+                factor = int(scale) / 100.0
+                for n in range(4):
+                    if region == "overview":
+                        frame, _ = synth.list_frame(region, scale, hostiles=1 + n % 3, blues=n % 2, neutrals=12,
+                                                    width=int(round(1300 * factor)), rows=24)
+                    else:
+                        frame, _ = synth.list_frame(region, scale, hostiles=1 + n % 3, blues=n % 2, neutrals=30,
+                                                    width=int(round(240 * factor)), rows=64)
+                    frames.append(frame)
+        corpus[region] = frames
+    corpus["safe_color"] = synth.icon_crops(scale)
+    return corpus
+
+
+def time_calls(fn, inputs, iterations):
+    samples = []
+    for _ in range(iterations):
+        for item in inputs:
+            t0 = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def summarize(samples):
+    if not samples:
+        return None
+    ms = np.array(samples) * 1000.0
+    mean = float(ms.mean())
+    return {
+        "calls": int(ms.size),
+        "mean_ms": round(mean, 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "fps": round(1000.0 / mean, 1) if mean > 0 else 0.0,
+    }
+
+
+def run_suite(engine, corpus_by_scale, iterations):
+    results = {}
+    for scale, corpus in corpus_by_scale.items():
+        # 始终用 100% 模板库做 count_matches，避免其它缩放模板缺失时测到空循环
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        entries = {}
+        for region in ["local", "overview", "monster", "probe"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            safe = region in ("local", "overview")
+            fn = lambda img, t=tmpls, s=safe: engine.count_matches(img, t, 0.95, check_safe_color=s)
+            entries[f"count_matches.{region}"] = summarize(time_calls(fn, corpus[region], iterations))
+
+        fn = lambda img: engine.match_location_name(img, tmpl_scale, 0.85)
+        entries["match_location_name"] = summarize(time_calls(fn, corpus["location"], iterations))
+        entries["detect_scale"] = summarize(time_calls(engine.detect_scale, corpus["local"], iterations))
+        entries["_is_safe_color"] = summarize(time_calls(engine._is_safe_color, corpus["safe_color"], iterations))
+        results[scale] = {k: v for k, v in entries.items() if v}
+    return results
+
+
+def frame_stream(frames):
+    """
+    按监控循环的方式排列帧: 每帧依次以 原帧 / 原帧重复 / 轻微变化 / 图标列变化 出现，返回 [(帧号, 形式, 帧)]
+    轻微变化: 右半幅 (名字文字部分) 亮度 +2，低于 TRACK_CHANGE_DELTA；图标本身不变
+    (变暗图标的分数、友军色判定都贴近阈值，改动图标像素会真的改变检测结果，与跟踪无关)
+    图标列变化: 左 1/8 幅亮度 +12，命中跟踪需要重新搜索，图标列以外不变 (ROI 收窄仍然生效)
+    配合固定的 key 使用，命中跟踪 / ROI 收窄等按区域学习的路径才会真正运行
+    """
+    out = []
+    for n, img in enumerate(frames):
+        changed = img.copy()
+        half = img.shape[1] // 2
+        changed[:, half:] = cv2.add(img[:, half:], (2, 2, 2, 0))
+        icons = img.copy()
+        band = img.shape[1] // 8
+        icons[:, :band] = cv2.add(img[:, :band], (12, 12, 12, 0))
+        out += [(n, "frame", img), (n, "repeat", img), (n, "changed", changed), (n, "icons", icons)]
+    return out
+
+
+def detections(engine, corpus_by_scale):
+    """对语料逐帧记录 count_matches 计数与位置识别结果；每个 (缩放, 区域) 为一路固定 key 的连续画面"""
+    engine.reset_region_state()
+    out = []
+    for scale, corpus in corpus_by_scale.items():
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        for region in ["local", "overview", "monster", "probe"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            safe = region in ("local", "overview")
+            key = (f"S{scale}", region)
+            for n, form, img in frame_stream(corpus[region]):
+                cnt, _ = engine.count_matches(img, tmpls, 0.95, check_safe_color=safe, key=key)
+                out.append(((scale, region, n, form), cnt))
+        for n, img in enumerate(corpus["location"]):
+            name, _ = engine.match_location_name(img, tmpl_scale, 0.85)
+            out.append(((scale, "location", n), name))
+    return out
+
+
+def verify_flag(engine, corpus_by_scale, flag):
+    """
+    分别在 flag 关闭/开启时跑语料，返回 (不一致的帧, 帧数, 开启时的计数器)
+    计数器 (track_verified / cluster_skipped 等) 用来确认被核对的路径确实运行过
+    """
+    original = getattr(engine, flag)
+    setattr(engine, flag, False)
+    engine.load_templates()
+    reference = detections(engine, corpus_by_scale)
+    setattr(engine, flag, True)
+    engine.load_templates()
+    engine.metrics.reset()
+    candidate = detections(engine, corpus_by_scale)
+    counters = {c["name"]: c["value"] for c in engine.metrics.snapshot()["counters"] if not c["labels"]}
+    setattr(engine, flag, original)
+    engine.load_templates()
+    mismatches = [(key, a, b) for (key, a), (_, b) in zip(reference, candidate) if a != b]
+    return mismatches, len(reference), counters
+
+
+def grab_suite(engine, backend, iterations, sizes=((420, 600), (1320, 420), (300, 40))):
+    """各典型区域尺寸的 capture_screen 耗时 (后端截图 + BGRA->BGR)"""
+    engine.set_capture_backend(backend)
+    results = {}
+    for w, h in sizes:
+        region = [0, 0, w, h]
+        if engine.capture_screen(region) is None:
+            print(f"{backend}: {engine.last_error}")
+            return results
+        samples = time_calls(engine.capture_screen, [region] * 10, iterations)
+        results[f"{w}x{h}"] = summarize(samples)
+    return results
+
+
+def alloc_suite(engine, corpus_by_scale):
+    """
+    tracemalloc 统计每次调用的临时分配峰值 (KiB)；按扫描循环的方式传入 key，复用缓冲
+    numpy / OpenCV 返回的数组都经 numpy 分配器，会被 tracemalloc 记录
+    """
+    results = {}
+    tracemalloc.start()
+    for scale, corpus in corpus_by_scale.items():
+        engine.reset_region_state()
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        entries = {}
+        calls = {}
+        for region in ["local", "overview", "monster", "probe"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            safe = region in ("local", "overview")
+            calls[f"count_matches.{region}"] = (
+                lambda img, t=tmpls, s=safe, r=region: engine.count_matches(img, t, 0.95, s, key=("bench", r)),
+                corpus[region])
+        calls["match_location_name"] = (lambda img: engine.match_location_name(img, tmpl_scale, 0.85,
+                                                                        key=("bench", "location")),
+                                        corpus["location"])
+        for name, (fn, frames) in calls.items():
+            fn(frames[0])
+            peaks = []
+            for img in frames:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                fn(img)
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            entries[name] = {"peak_kib_mean": round(float(np.mean(peaks)) / 1024.0, 1),
+                             "peak_kib_max": round(float(np.max(peaks)) / 1024.0, 1)}
+        entries["scratch_buffers"] = {"peak_kib_mean": round(engine.buffer_bytes / 1024.0, 1),
+                                      "peak_kib_max": round(engine.buffer_bytes / 1024.0, 1)}
+        results[scale] = entries
+    tracemalloc.stop()
+    engine.reset_region_state()
+    return results
+
+
+def mosaic_suite(engine, corpus_by_scale, clients, iterations):
+    """
+    模拟 clients 个同缩放客户端: 每个区域类型取 clients 帧，
+    分别用逐帧 count_matches 与 count_matches_batch 计时，并核对两者的 (count, score)
+    """
+    results = {}
+    mismatches = []
+    for scale, corpus in corpus_by_scale.items():
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        entries = {}
+        for region in ["local", "overview", "monster", "probe"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            safe = region in ("local", "overview")
+            frames = corpus[region]
+            groups = [[(None, frames[(g + c) % len(frames)]) for c in range(clients)]
+                      for g in range(len(frames))]
+            single = lambda grp: [engine.count_matches(img, tmpls, 0.95, safe) for _, img in grp]
+            batch = lambda grp: engine.count_matches_batch(grp, tmpls, 0.95, safe)
+            # 聚类/金字塔会跳过低分模板，未命中帧的最高分 (阈值以下) 两条路径不可比，只核对计数与命中帧的分数
+            for grp in groups:
+                a, b = single(grp), batch(grp)
+                if any(x[0] != y[0] or (x[0] and abs(x[1] - y[1]) > 1e-4) for x, y in zip(a, b)):
+                    mismatches.append((scale, region, a, b))
+            entries[f"single.{region}"] = summarize(time_calls(single, groups, iterations))
+            entries[f"mosaic.{region}"] = summarize(time_calls(batch, groups, iterations))
+        results[scale] = entries
+    return results, mismatches
+
+
+def tile_suite(engine, synth, scales, tile_rows, iterations, heights=(1400, 2100)):
+    """
+    整列本地栏 (1440p / 4K 全高) 画面: TILE_PARALLEL 关闭与各 TILE_ROWS 下 count_matches 的耗时，
+    并核对计数与分数一致
+    """
+    results = {}
+    mismatches = []
+    original = (engine.TILE_PARALLEL, engine.TILE_ROWS)
+    for scale in scales:
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        tmpls = engine.templates["local"].get(tmpl_scale, [])
+        row_h = int(round(20 * int(scale) / 100.0))
+        entries = {}
+        for height in heights:
+            frames = [synth.list_frame("local", scale, hostiles=n % 4, blues=n % 3, neutrals=40 + n,
+                                       rows=height // row_h)[0] for n in range(4)]
+            run = lambda img: engine.count_matches(img, tmpls, 0.95, True)
+            engine.TILE_PARALLEL = False
+            reference = [run(img) for img in frames]
+            entries[f"h{height}.untiled"] = summarize(time_calls(run, frames, iterations))
+            engine.TILE_PARALLEL = True
+            for rows in tile_rows:
+                engine.TILE_ROWS = rows
+                got = [run(img) for img in frames]
+                if any(a[0] != b[0] or abs(a[1] - b[1]) > 1e-4 for a, b in zip(reference, got)):
+                    mismatches.append((scale, height, rows, reference, got))
+                entries[f"h{height}.tile{rows}"] = summarize(time_calls(run, frames, iterations))
+        results[scale] = entries
+    engine.TILE_PARALLEL, engine.TILE_ROWS = original
+    return results, mismatches
+
+
+def sea_suite(engine, corpus_by_scale, iterations):
+    """SEA_PREFILTER 关闭/开启时 Local/Overview 的 count_matches 耗时，以及上界排除的位置比例"""
+    def counter(name, region):
+        for c in engine.metrics.snapshot()["counters"]:
+            if c["name"] == name and c["labels"].get("region") == region:
+                return c["value"]
+        return 0
+
+    original = engine.SEA_PREFILTER
+    results = {}
+    for scale, corpus in corpus_by_scale.items():
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        entries = {}
+        for region in ["local", "overview"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            run = lambda img: engine.count_matches(img, tmpls, 0.95, True)
+            engine.SEA_PREFILTER = False
+            entries[f"{region}.off"] = summarize(time_calls(run, corpus[region], iterations))
+            engine.SEA_PREFILTER = True
+            positions, pruned = counter("sea_positions", region), counter("sea_pruned", region)
+            entries[f"{region}.sea"] = summarize(time_calls(run, corpus[region], iterations))
+            positions = counter("sea_positions", region) - positions
+            pruned = counter("sea_pruned", region) - pruned
+            entries[f"{region}.sea"]["pruned"] = pruned / positions if positions else 0.0
+        results[scale] = entries
+    engine.SEA_PREFILTER = original
+    return results
+
+
+def engine_suite(engine, corpus_by_scale, name, iterations):
+    """DETECTION_ENGINE 为 template 与 name 时 Local/Overview 的 count_matches 耗时及计数一致的帧数"""
+    original = engine.DETECTION_ENGINE
+    results = {}
+    agreement = {}
+    for scale, corpus in corpus_by_scale.items():
+        tmpl_scale = scale if engine.templates["local"].get(scale) else "100"
+        entries = {}
+        for region in ["local", "overview"]:
+            tmpls = engine.templates[region].get(tmpl_scale, [])
+            run = lambda img: engine.count_matches(img, tmpls, 0.95, True)
+            counts = {}
+            for mode in ("template", name):
+                engine.DETECTION_ENGINE = mode
+                counts[mode] = [run(img)[0] for img in corpus[region]]
+                entries[f"{region}.{mode}"] = summarize(time_calls(run, corpus[region], iterations))
+            same = sum(1 for a, b in zip(counts["template"], counts[name]) if a == b)
+            agreement[(scale, region)] = (same, len(corpus[region]))
+        results[scale] = entries
+    engine.DETECTION_ENGINE = original
+    return results, agreement
+
+
+def location_suite(engine, corpus_by_scale, iterations):
+    """LOCATION_ENGINE 为 templates 与 glyphs (不回退) 时 match_location_name 的耗时及识别名字一致的帧数"""
+    original = engine.LOCATION_ENGINE, engine.LOCATION_TEMPLATE_FALLBACK
+    engine.LOCATION_TEMPLATE_FALLBACK = False
+    results = {}
+    agreement = {}
+    for scale, corpus in corpus_by_scale.items():
+        tmpl_scale = scale if engine.templates["location"].get(scale) else "100"
+        run = lambda img: engine.match_location_name(img, tmpl_scale, 0.85)
+        entries = {}
+        names = {}
+        for mode in ("templates", "glyphs"):
+            engine.LOCATION_ENGINE = mode
+            names[mode] = [run(img)[0] for img in corpus["location"]]
+            entries[f"location.{mode}"] = summarize(time_calls(run, corpus["location"], iterations))
+        same = sum(1 for a, b in zip(names["templates"], names["glyphs"]) if a == b)
+        agreement[scale] = (same, len(corpus["location"]))
+        results[scale] = entries
+    engine.LOCATION_ENGINE, engine.LOCATION_TEMPLATE_FALLBACK = original
+    return results, agreement
+
+
+def compare(results, baseline, tolerance):
+    """返回回归列表: (scale, entry, base_p50, now_p50)"""
+    regressions = []
+    for scale, entries in results.items():
+        for name, stats in entries.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            if stats["p50_ms"] > base["p50_ms"] * (1.0 + tolerance):
+                regressions.append((scale, name, base["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    print(f"{'scale':>5}  {'entry':<26}{'p50':>9}{'p90':>9}{'p99':>9}{'fps':>10}  {'vs base':>8}")
+    for scale, entries in results.items():
+        for name, s in entries.items():
+            delta = ""
+            base = (baseline or {}).get(scale, {}).get(name)
+            if base and base["p50_ms"] > 0:
+                delta = f"{(s['p50_ms'] / base['p50_ms'] - 1.0) * 100:+.1f}%"
+            print(f"{scale:>5}  {name:<26}{s['p50_ms']:>9.3f}{s['p90_ms']:>9.3f}"
+                  f"{s['p99_ms']:>9.3f}{s['fps']:>10.1f}  {delta:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VisionEngine benchmark suite")
+    parser.add_argument("--corpus", help="recorded frame corpus: <dir>/<scale>/<region>/*.png")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--scales", default="90,100,125")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed p50 slowdown vs baseline (0.15 = 15%%)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--verify", metavar="FLAG",
+                        help="compare detections with a VisionEngine flag off vs on (e.g. CLUSTER_TEMPLATES)")
+    parser.add_argument("--grab", metavar="BACKEND", help="time capture_screen with a capture backend (mss/xshm/memory)")
+    parser.add_argument("--alloc", action="store_true", help="report per-call transient allocations (tracemalloc)")
+    parser.add_argument("--tiles", metavar="ROWS",
+                        help="comma-separated TILE_ROWS values to time on full-height Local frames")
+    parser.add_argument("--engine", metavar="NAME",
+                        help="compare a DETECTION_ENGINE (e.g. rows) against template matching")
+    parser.add_argument("--location", action="store_true",
+                        help="compare glyph-level location recognition against per-system template matching")
+    parser.add_argument("--sea", action="store_true",
+                        help="time the SEA upper-bound prefilter and report the fraction of positions pruned")
+    parser.add_argument("--mosaic", type=int, metavar="CLIENTS",
+                        help="time per-client count_matches vs count_matches_batch for CLIENTS same-scale clients")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    engine = VisionEngine()
+    # 基准反复匹配同一批帧，结果缓存会让计时失真；需要时用 --verify RESULT_CACHE 单独核对
+    engine.RESULT_CACHE = False
+    synth = FrameSynth(os.path.join(ROOT, "assets"), seed=args.seed, is_safe=engine._is_safe_color)
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    corpus_by_scale = {s: build_corpus(engine, synth, s, args.corpus) for s in scales}
+
+    if args.grab:
+        results = grab_suite(engine, args.grab, args.iterations)
+        print(f"{'backend':>7}  {'region':<26}{'p50':>9}{'p90':>9}{'p99':>9}{'fps':>10}")
+        for name, s in results.items():
+            print(f"{args.grab:>7}  {name:<26}{s['p50_ms']:>9.3f}{s['p90_ms']:>9.3f}{s['p99_ms']:>9.3f}{s['fps']:>10.1f}")
+        return 0 if results else 1
+
+    if args.alloc:
+        results = alloc_suite(engine, corpus_by_scale)
+        print(f"{'scale':>5}  {'entry':<26}{'mean KiB':>10}{'max KiB':>10}")
+        for scale, entries in results.items():
+            for name, a in entries.items():
+                print(f"{scale:>5}  {name:<26}{a['peak_kib_mean']:>10.1f}{a['peak_kib_max']:>10.1f}")
+        return 0
+
+    if args.tiles:
+        print(f"tile workers: {engine.TILE_WORKERS}")
+        rows = [int(r) for r in args.tiles.split(",") if r.strip()]
+        results, mismatches = tile_suite(engine, synth, scales, rows, args.iterations)
+        print_table(results)
+        for scale, height, r, a, b in mismatches:
+            print(f"  MISMATCH {scale}/h{height}/tile{r}: untiled -> {a}, tiled -> {b}")
+        return 1 if mismatches else 0
+
+    if args.engine:
+        results, agreement = engine_suite(engine, corpus_by_scale, args.engine, args.iterations)
+        print_table(results)
+        for (scale, region), (same, total) in agreement.items():
+            print(f"{scale:>5}  {region:<26}counts agree on {same}/{total} frames")
+        return 0 if all(same == total for same, total in agreement.values()) else 1
+
+    if args.location:
+        results, agreement = location_suite(engine, corpus_by_scale, args.iterations)
+        print_table(results)
+        for scale, (same, total) in agreement.items():
+            print(f"{scale:>5}  {'location':<26}names agree on {same}/{total} frames")
+        return 0 if all(same == total for same, total in agreement.values()) else 1
+
+    if args.sea:
+        results = sea_suite(engine, corpus_by_scale, args.iterations)
+        print_table(results)
+        for scale, entries in results.items():
+            for name, s in entries.items():
+                if "pruned" in s:
+                    print(f"{scale:>5}  {name:<26}pruned {s['pruned'] * 100:.2f}% of positions")
+        return 0
+
+    if args.mosaic:
+        results, mismatches = mosaic_suite(engine, corpus_by_scale, args.mosaic, args.iterations)
+        print_table(results)
+        for scale, region, a, b in mismatches:
+            print(f"  MISMATCH {scale}/{region}: single -> {a}, mosaic -> {b}")
+        return 1 if mismatches else 0
+
+    if args.verify:
+        mismatches, total, counters = verify_flag(engine, corpus_by_scale, args.verify)
+        for key, ref, got in mismatches:
+            print(f"  MISMATCH {key}: {args.verify}=False -> {ref}, True -> {got}")
+        if counters:
+            print("  counters: " + ", ".join(f"{k}={v}" for k, v in sorted(counters.items())))
+        print(f"{args.verify}: {total - len(mismatches)}/{total} frames identical")
+        return 1 if mismatches else 0
+
+    # 预热一次，排除首次调用的初始化开销
+    run_suite(engine, corpus_by_scale, 1)
+    results = run_suite(engine, corpus_by_scale, args.iterations)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (> {args.tolerance * 100:.0f}% slower p50):")
+            for scale, name, base, now in regressions:
+                print(f"  [{scale}] {name}: {base:.3f}ms -> {now:.3f}ms")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance * 100:.0f}%.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import os
+import cv2
+import numpy as np
+
+# 合成帧语料：把 assets/*/100 下的真实模板贴到类 EVE 的深色噪声背景上
+# 录制语料目录结构: <corpus>/<scale>/<region>/*.png
+
+REGION_FOLDERS = {
+    "local": "hostile_icons_local",
+    "overview": "hostile_icons_overview",
+    "monster": "monster_icons",
+    "probe": "probe_icons",
+    "location": "location",
+}
+
+
+def _read(path):
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+
+def load_recorded(corpus_dir, scale, region):
+    frames = []
+    folder = os.path.join(corpus_dir, scale, region)
+    if not os.path.isdir(folder):
+        return frames
+    for filename in sorted(os.listdir(folder)):
+        if filename.lower().endswith(('.png', '.jpg', '.bmp')):
+            img = _read(os.path.join(folder, filename))
+            if img is not None:
+                frames.append(img)
+    return frames
+
+
+class FrameSynth:
+    def __init__(self, assets_dir, seed=0, is_safe=None):
+        # is_safe: 可传入 VisionEngine._is_safe_color，本身带蓝/绿像素的模板不作为敌对样本
+        self.rng = np.random.default_rng(seed)
+        self.masters = {}
+        for region, folder in REGION_FOLDERS.items():
+            items = []
+            path = os.path.join(assets_dir, folder, "100")
+            if os.path.isdir(path):
+                for filename in sorted(os.listdir(path)):
+                    if filename.lower().endswith(('.png', '.jpg', '.bmp')):
+                        img = _read(os.path.join(path, filename))
+                        if img is None:
+                            continue
+                        if is_safe and region in ("local", "overview") and is_safe(img):
+                            continue
+                        items.append((os.path.splitext(filename)[0], img))
+            self.masters[region] = items
+
+    def scaled(self, img, scale):
+        factor = int(scale) / 100.0
+        if factor == 1.0:
+            return img
+        h, w = img.shape[:2]
+        size = (max(1, int(round(w * factor))), max(1, int(round(h * factor))))
+        interp = cv2.INTER_AREA if factor < 1.0 else cv2.INTER_LINEAR
+        return cv2.resize(img, size, interpolation=interp)
+
+    def background(self, h, w):
+        base = np.array([16, 14, 12], dtype=np.float32) + self.rng.normal(0, 3.0, (h, w, 3))
+        return np.clip(base, 0, 255).astype(np.uint8)
+
+    def recolor_blue(self, icon):
+        # 友军图标：把图标染成蓝色，_is_safe_color 会把它排除
+        hsv = cv2.cvtColor(icon, cv2.COLOR_BGR2HSV)
+        lit = hsv[..., 2] > 40
+        hsv[..., 0][lit] = 110
+        hsv[..., 1][lit] = np.maximum(hsv[..., 1][lit], 160)
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    def draw_name(self, frame, x, y, row_h, scale):
+        # 玩家名字：随机字符，灰白色
+        chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+        n = int(self.rng.integers(5, 14))
+        text = "".join(chars[int(i)] for i in self.rng.integers(0, len(chars), n))
+        font_scale = 0.35 * int(scale) / 100.0
+        shade = int(self.rng.integers(150, 220))
+        baseline_y = y + int(row_h * 0.75)
+        cv2.putText(frame, text, (x, baseline_y), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (shade, shade, shade), 1, cv2.LINE_AA)
+
+    def fade(self, icon, dim=1.0, haze=0.0):
+        # 图标变暗 (亮度乘 dim) / 低对比度 (与灰色按 haze 混合)，模拟半透明窗口遮挡
+        out = icon.astype(np.float32) * dim
+        if haze:
+            out = out * (1.0 - haze) + 60.0 * haze
+        return np.clip(out, 0, 255).astype(np.uint8)
+
+    def list_frame(self, region, scale, hostiles=0, blues=0, neutrals=0, width=None, rows=None, dim=1.0, haze=0.0,
+                   icon_x=None):
+        """
+        生成列表类画面 (Local / Overview)，返回 (frame, truth)
+        truth 为敌对图标框列表 [(x, y, w, h), ...]
+        dim / haze: 图标变暗 / 低对比度 (见 fade)；icon_x: 图标列位置 (100% 像素，默认 4，模拟调整过列顺序的总览)
+        """
+        masters = self.masters.get(region) or []
+        factor = int(scale) / 100.0
+        row_h = int(round((20 if region == "local" else 22) * factor))
+        total = hostiles + blues + neutrals
+        rows = max(rows or 0, total)
+        width = width or int(round(180 * factor))
+        height = max(row_h * rows, row_h)
+        frame = self.background(height, width)
+
+        kinds = ["hostile"] * hostiles + ["blue"] * blues + ["neutral"] * neutrals
+        kinds += ["empty"] * (rows - total)
+        self.rng.shuffle(kinds)
+
+        icon_x = int(round((4 if icon_x is None else icon_x) * factor))
+        truth = []
+        for row, kind in enumerate(kinds):
+            y = row * row_h
+            if kind == "empty":
+                continue
+            name_x = icon_x + int(round(22 * factor))
+            self.draw_name(frame, name_x, y, row_h, scale)
+            if kind == "neutral" or not masters:
+                continue
+            _, master = masters[int(self.rng.integers(0, len(masters)))]
+            icon = self.scaled(master, scale)
+            if kind == "blue":
+                icon = self.recolor_blue(icon)
+            if dim != 1.0 or haze:
+                icon = self.fade(icon, dim, haze)
+            ih, iw = icon.shape[:2]
+            iy = y + max(0, (row_h - ih) // 2)
+            if iy + ih > height or icon_x + iw > width:
+                continue
+            frame[iy:iy + ih, icon_x:icon_x + iw] = icon
+            if kind == "hostile":
+                truth.append((icon_x, iy, iw, ih))
+        return frame, truth
+
+    def text_frame(self, region, scale, present=True, rows=6, width=None):
+        """生成 Probe / Monster 画面：若 present，随机一行贴上模板"""
+        masters = self.masters.get(region) or []
+        factor = int(scale) / 100.0
+        row_h = int(round(20 * factor))
+        width = width or int(round(200 * factor))
+        frame = self.background(row_h * rows, width)
+        hit_row = int(self.rng.integers(0, rows)) if present and masters else -1
+        truth = []
+        for row in range(rows):
+            y = row * row_h
+            if row != hit_row:
+                self.draw_name(frame, 4, y, row_h, scale)
+                continue
+            _, master = masters[int(self.rng.integers(0, len(masters)))]
+            tmpl = self.scaled(master, scale)
+            th, tw = tmpl.shape[:2]
+            tw = min(tw, width - 4)
+            th = min(th, frame.shape[0] - y)
+            frame[y:y + th, 4:4 + tw] = tmpl[:th, :tw]
+            truth.append((4, y, tw, th))
+        return frame, truth
+
+    def location_frame(self, scale, name=None):
+        """生成位置栏画面，返回 (frame, system_name)"""
+        masters = self.masters.get("location") or []
+        factor = int(scale) / 100.0
+        width = int(round(160 * factor))
+        height = int(round(28 * factor))
+        frame = self.background(height, width)
+        if not masters:
+            return frame, None
+        if name is None:
+            name, img = masters[int(self.rng.integers(0, len(masters)))]
+        else:
+            img = dict(masters).get(name)
+            if img is None:
+                return frame, None
+        img = self.scaled(img, scale)
+        ih, iw = img.shape[:2]
+        ih, iw = min(ih, height), min(iw, width - 6)
+        y = (height - ih) // 2
+        frame[y:y + ih, 6:6 + iw] = img[:ih, :iw]
+        return frame, name
+
+    def icon_crops(self, scale, count=32):
+        """生成 _is_safe_color 输入：敌对 / 友军图标切片混合"""
+        crops = []
+        masters = (self.masters.get("local") or []) + (self.masters.get("overview") or [])
+        for _ in range(count if masters else 0):
+            _, master = masters[int(self.rng.integers(0, len(masters)))]
+            icon = self.scaled(master, scale)
+            if self.rng.random() < 0.5:
+                icon = self.recolor_blue(icon)
+            crops.append(icon)
+        return crops
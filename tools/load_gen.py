@@ -0,0 +1,230 @@
+"""
+多客户端合成负载生成器
+
+用法 (在项目根目录执行):
+    python -m tools.load_gen --clients 1,2,5,10 --scale 100 --interval 0.5 --duration 8
+    python -m tools.load_gen --clients 10,20 --budget 300   # 周期预算 300ms，Monster/Probe/Location 轮转
+
+为每个模拟客户端合成 Local / Overview / Rats / Probe / Location 画面
+（真实模板 + 类 EVE 背景，敌对/友军/中立数量可控），驱动 AlarmWorker 运行，
+随 N 增长报告周期耗时、CPU 占用、检测准确率（与合成时的真值比较）
+以及可选区域 (Monster/Probe) 距上次扫描的最长时间 (调度器轮转时的陈旧度)。
+"""
+import os
+import re
+import sys
+import time
+import copy
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PyQt6.QtCore import Qt
+
+from core.config_manager import DEFAULT_CONFIG
+from core.vision import VisionEngine
+from core.capture_backends import MemoryBackend
+from core.audio_logic import AlarmWorker
+from tools.corpus import FrameSynth
+
+REGION_KEYS = ["local", "overview", "monster", "probe", "location"]
+LOG_RE = re.compile(r"-C(\d+)\] L:(\d+)\(\d+\)\S* O:(\d+)\(\d+\)\S* M:(\d+)\(\d+\)\S* P:(\d+)\(\d+\)")
+
+
+class SimConfig:
+    """内存配置，接口与 ConfigManager 一致但不落盘"""
+    def __init__(self, groups, scan_interval, jitter_delay):
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.config["groups"] = groups
+        self.config["scan_interval"] = scan_interval
+        self.config["jitter_delay"] = jitter_delay
+        self.config["webhook_url"] = ""
+        self.listeners = []
+
+    def get(self, key):
+        return self.config.get(key)
+
+    def set(self, key, value):
+        self.config[key] = value
+        for fn in list(self.listeners):
+            fn(key, value)
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def get_audio_path(self, key):
+        return ""
+
+
+class SyntheticVision(VisionEngine):
+    """画面来自内存截图后端 (按区域坐标轮换预先合成的变体)，并记录 C1 Local 的抓图时刻"""
+    def __init__(self):
+        super().__init__()
+        self.memory = MemoryBackend()
+        self.set_capture_backend("memory", self.memory)
+        self.cycle_marks = []
+        self.mark_region = None
+
+    def capture_screen(self, region, debug_name=None):
+        if region and tuple(region) == self.mark_region:
+            self.cycle_marks.append(time.perf_counter())
+        return super().capture_screen(region, debug_name)
+
+
+def build_clients(synth, vision, n_clients, scale, rng, variants=3):
+    """生成 N 个客户端的分组配置与真值，并把画面注册到 SyntheticVision"""
+    groups, truth = [], []
+    vision.memory.clear()
+    for i in range(n_clients):
+        hostiles = int(rng.integers(0, 4))
+        blues = int(rng.integers(0, 4))
+        neutrals = int(rng.integers(4, 11))
+        ovr_hostiles = int(rng.integers(0, 3))
+        monster = bool(rng.random() < 0.5)
+        probe = bool(rng.random() < 0.3)
+
+        regions = {}
+        for r_idx, key in enumerate(REGION_KEYS):
+            regions[key] = [i * 1000 + r_idx * 200, 0, 0, 0]
+
+        def register(key, frames):
+            h, w = frames[0].shape[:2]
+            regions[key][2], regions[key][3] = w, h
+            vision.memory.set_frames(regions[key], frames)
+
+        register("local", [synth.list_frame("local", scale, hostiles, blues, neutrals, rows=24)[0]
+                           for _ in range(variants)])
+        register("overview", [synth.list_frame("overview", scale, ovr_hostiles, blues, neutrals, rows=24)[0]
+                              for _ in range(variants)])
+        register("monster", [synth.text_frame("monster", scale, present=monster)[0] for _ in range(variants)])
+        register("probe", [synth.text_frame("probe", scale, present=probe)[0] for _ in range(variants)])
+        system = synth.location_frame(scale)
+        register("location", [system[0]] * variants)
+
+        groups.append({
+            "id": i,
+            "name": f"Client {i+1}",
+            "scale": scale,
+            "regions": regions,
+        })
+        truth.append({"local": hostiles, "overview": ovr_hostiles,
+                      "monster": int(monster), "probe": int(probe), "location": system[1]})
+    return groups, truth
+
+
+def run_load(vision, synth, n_clients, scale, interval, jitter, duration, seed, workers=0, budget=0):
+    rng = np.random.default_rng(seed)
+    groups, truth = build_clients(synth, vision, n_clients, scale, rng)
+    vision.mark_region = tuple(groups[0]["regions"]["local"])
+    vision.cycle_marks = []
+
+    cfg = SimConfig(groups, interval, jitter)
+    cfg.set("vision_workers", workers)
+    cfg.set("cycle_budget_ms", budget)
+    worker = AlarmWorker(cfg, vision)
+    lines, ends = [], []
+    last_client = f"-C{n_clients}]"
+
+    def on_log(msg):
+        now = time.perf_counter()
+        lines.append(msg)
+        if last_client in msg and " L:" in msg:
+            ends.append(now)
+
+    worker.log_signal.connect(on_log, type=Qt.ConnectionType.DirectConnection)
+
+    worker.start()
+    # 首轮会重新加载模板并休眠 1 秒，跳过预热期 (工作进程启动另需时间)
+    time.sleep(3.0 if workers else 1.5)
+    warm_lines = len(lines)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    time.sleep(duration)
+    cpu1, wall1 = time.process_time(), time.perf_counter()
+    worker.stop(wait=True)
+    stale = [g["value"] for g in vision.metrics.snapshot()["gauges"]
+             if g["name"] == "scan_staleness_seconds" and g["labels"].get("region") in ("monster", "probe")]
+
+    # CPU 只统计主进程 (扫描线程 + 抓图)；工作进程的占用不计入
+    # 周期耗时: 从 C1 Local 抓图到最后一个客户端日志输出
+    marks = [t for t in vision.cycle_marks if wall0 <= t <= wall1]
+    work = []
+    for start in marks:
+        later = [e for e in ends if e >= start]
+        if later:
+            work.append(later[0] - start)
+    periods = np.diff(marks) if len(marks) > 1 else np.array([])
+
+    # 准确率: 每条日志与真值比较
+    checked = correct = 0
+    for msg in lines[warm_lines:]:
+        m = LOG_RE.search(msg)
+        if not m:
+            continue
+        idx = int(m.group(1)) - 1
+        t = truth[idx]
+        got = [int(m.group(k)) for k in range(2, 6)]
+        want = [t["local"], t["overview"], t["monster"], t["probe"]]
+        for g, w, key in zip(got, want, ["local", "overview", "monster", "probe"]):
+            checked += 1
+            if key in ("monster", "probe"):
+                correct += int((g > 0) == (w > 0))
+            else:
+                correct += int(g == w)
+
+    work_ms = np.array(work) * 1000.0
+    return {
+        "clients": n_clients,
+        "cycles": len(work),
+        "cycle_mean_ms": float(work_ms.mean()) if work_ms.size else 0.0,
+        "cycle_p95_ms": float(np.percentile(work_ms, 95)) if work_ms.size else 0.0,
+        "period_mean_ms": float(periods.mean() * 1000.0) if periods.size else 0.0,
+        "cpu_pct": 100.0 * (cpu1 - cpu0) / max(wall1 - wall0, 1e-9),
+        "accuracy": correct / checked if checked else 0.0,
+        "stale_max_s": max(stale) if stale else 0.0,
+        "overrun": bool(work_ms.size and np.percentile(work_ms, 95) > interval * 1000.0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic multi-client load generator")
+    parser.add_argument("--clients", default="1,2,3,5,8")
+    parser.add_argument("--scale", default="100")
+    parser.add_argument("--interval", type=float, default=0.5, help="scan_interval in seconds")
+    parser.add_argument("--jitter", type=float, default=0.18, help="jitter_delay in seconds")
+    parser.add_argument("--duration", type=float, default=6.0, help="measured seconds per step")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0, help="vision_workers (0 = in-process matching)")
+    parser.add_argument("--budget", type=float, default=0,
+                        help="cycle_budget_ms (0 = scan_interval)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="keep the match-result cache on (off by default: the few rotating variants "
+                             "repeat exactly and would be served from cache)")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    vision = SyntheticVision()
+    vision.RESULT_CACHE = args.result_cache
+    synth = FrameSynth(os.path.join(ROOT, "assets"), seed=args.seed, is_safe=vision._is_safe_color)
+    steps = [int(n) for n in args.clients.split(",") if n.strip()]
+
+    print(f"scale={args.scale}%  scan_interval={args.interval}s  jitter_delay={args.jitter}s"
+          f"  vision_workers={args.workers}")
+    print(f"{'N':>3}{'cycles':>8}{'work ms':>10}{'p95 ms':>10}{'period':>10}{'CPU %':>8}{'acc':>8}{'stale s':>9}")
+    capacity = 0
+    for n in steps:
+        r = run_load(vision, synth, n, args.scale, args.interval, args.jitter, args.duration, args.seed + n,
+                     args.workers, args.budget)
+        flag = "  OVERRUN" if r["overrun"] else ""
+        print(f"{n:>3}{r['cycles']:>8}{r['cycle_mean_ms']:>10.1f}{r['cycle_p95_ms']:>10.1f}"
+              f"{r['period_mean_ms']:>10.1f}{r['cpu_pct']:>8.1f}{r['accuracy'] * 100:>7.1f}%"
+              f"{r['stale_max_s']:>9.2f}{flag}")
+        if not r["overrun"]:
+            capacity = n
+    print(f"\nMax clients without overrun at {args.interval}s: {capacity}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
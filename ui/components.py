@@ -57,9 +57,10 @@ def resource_path(relative_path):
 
 # === 设置窗口 ===
 class SettingsDialog(QDialog):
-    def __init__(self, cfg, parent=None):
+    def __init__(self, cfg, parent=None, profiler=None):
         super().__init__(parent)
         self.cfg = cfg
+        self.profiler = profiler
         self.setWindowTitle("Advanced Settings")
         self.setWindowModality(Qt.WindowModality.ApplicationModal)
         self.resize(500, 700)
@@ -239,6 +240,23 @@ class SettingsDialog(QDialog):
             
         grp_audio.setLayout(grid_audio)
         layout.addWidget(grp_audio)
+
+        # 5. 诊断
+        if self.profiler is not None:
+            grp_diag = QGroupBox("Diagnostics")
+            grp_diag.setStyleSheet(gb_style)
+            l_diag = QHBoxLayout()
+            self.lbl_profile = QLabel(f"Profile next {self.profiler.default_cycles} scan cycles")
+            self.lbl_profile.setStyleSheet("color: #888;")
+            btn_profile = QPushButton("PROFILE")
+            btn_profile.setFixedSize(80, 24)
+            btn_profile.setStyleSheet(BTN_STYLE)
+            btn_profile.clicked.connect(self.request_profile)
+            l_diag.addWidget(self.lbl_profile)
+            l_diag.addStretch()
+            l_diag.addWidget(btn_profile)
+            grp_diag.setLayout(l_diag)
+            layout.addWidget(grp_diag)
         
         btn_close = QPushButton("CLOSE SETTINGS")
         btn_close.setFixedHeight(35)
@@ -249,6 +267,11 @@ class SettingsDialog(QDialog):
         scroll.setWidget(content_widget)
         main_layout.addWidget(scroll)
 
+    def request_profile(self):
+        self.profiler.request()
+        self.lbl_profile.setText("Queued: results go to ./profiles/")
+        self.lbl_profile.setStyleSheet("color: #00bcd4;")
+
     def select_audio(self, key, label_widget):
         fname, _ = QFileDialog.getOpenFileName(self, "Select Audio", "", "Audio (*.wav *.mp3)")
         if fname:
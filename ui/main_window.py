@@ -61,7 +61,7 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         pos = [self.x(), self.y()]
         self.cfg.set("window_pos", pos)
-        self.logic.stop()
+        self.logic.stop(wait=True)
         event.accept()
 
     def init_core(self):
@@ -199,14 +199,9 @@ class MainWindow(QMainWindow):
         for i, grp in enumerate(groups):
             w = GroupWidget(grp, i, self)
             self.scroll_layout.insertWidget(i, w)
-            
-        if hasattr(self, 'btn_add_group'):
-            self.btn_add_group.setEnabled(len(groups) < 5)
 
     def add_group(self):
         groups = self.cfg.get("groups")
-        if len(groups) >= 5: return
-        
         new_id = len(groups)
         new_group = {
             "id": new_id,
@@ -234,7 +229,7 @@ class MainWindow(QMainWindow):
         self.log(f"System: Removed Client Group")
 
     def open_settings(self):
-        dlg = SettingsDialog(self.cfg, self)
+        dlg = SettingsDialog(self.cfg, self, profiler=self.logic.profiler)
         dlg.exec()
         self.load_sounds()
 